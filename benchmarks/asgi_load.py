@@ -0,0 +1,187 @@
+"""
+Load test the WSGI and ASGI deployments with the same number of workers
+
+Both run under gunicorn, with sync workers for liveup.wsgi and uvicorn
+workers for liveup.asgi, see the Procfile. Every client thread sends its
+requests one after another on a new connection.
+
+    python -m benchmarks.asgi_load [--rows 20000] [--workers 2]
+        [--concurrency 32] [--requests 2000]
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.utils import benchmark_database, percentile, setup_django
+
+SERVERS = {
+    "wsgi": ["liveup.wsgi"],
+    "asgi": ["liveup.asgi:application", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+PATHS = {
+    "receptionist stats": ("/api/v1/receptionists/stats/", "receptionist"),
+    "clinician stats": ("/api/v1/medics/stats/", "doctor"),
+    "patients": ("/api/v1/patients/", "doctor"),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def server_environment():
+    """Points the servers at the benchmark database"""
+    from django.db import connection
+
+    database = connection.settings_dict
+    environment = dict(os.environ)
+    environment.pop("DATABASE_URL", None)
+    environment.update(
+        POSTGRES_NAME=database["NAME"],
+        POSTGRES_USER=database["USER"],
+        POSTGRES_PASSWORD=database["PASSWORD"],
+        DB_HOST=database["HOST"],
+        DB_PORT=str(database["PORT"]),
+    )
+    return environment
+
+
+def start_server(mode, workers, port):
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        *SERVERS[mode],
+        "--workers",
+        str(workers),
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--log-level",
+        "warning",
+    ]
+    process = subprocess.Popen(command, env=server_environment())
+    wait_for(port)
+    return process
+
+
+def load(port, path, token, concurrency, total):
+    timings = []
+    errors = []
+    lock = threading.Lock()
+    remaining = iter(range(total))
+
+    def client():
+        headers = {"Authorization": f"Bearer {token}", "Connection": "close"}
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            start = time.perf_counter()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                ok = False
+            finally:
+                connection.close()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                (timings if ok else errors).append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    return {
+        "rps": len(timings) / duration,
+        "mean_ms": statistics.mean(timings) if timings else 0,
+        "p50_ms": percentile(timings, 50) if timings else 0,
+        "p99_ms": percentile(timings, 99) if timings else 0,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from benchmarks.stats import seed
+    from main.counters import rebuild_counters
+    from main.serializers import CustomTokenClaimsSerializer
+
+    results = {}
+    with benchmark_database():
+        receptionist, doctor = seed(args.rows)
+        rebuild_counters()
+        tokens = {
+            "receptionist": CustomTokenClaimsSerializer.get_token(
+                receptionist
+            ).access_token,
+            "doctor": CustomTokenClaimsSerializer.get_token(doctor).access_token,
+        }
+
+        for mode in SERVERS:
+            port = free_port()
+            server = start_server(mode, args.workers, port)
+            try:
+                for name, (path, user) in PATHS.items():
+                    token = tokens[user]
+                    # warm up the workers and their caches
+                    load(port, path, token, args.concurrency, args.concurrency * 2)
+                    results[f"{name} ({mode})"] = load(
+                        port, path, token, args.concurrency, args.requests
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(
+        f"{args.workers} workers, {args.concurrency} concurrent clients, "
+        f"{args.requests} requests per case"
+    )
+    print(
+        f"{'case':<32} {'req/s':>9} {'mean ms':>9} {'p50 ms':>9} "
+        f"{'p99 ms':>9} {'errors':>7}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<32} {result['rps']:>9.1f} {result['mean_ms']:>9.2f} "
+            f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""
+Latency, throughput and queries per request of the main endpoints, with
+results stored as JSON baselines to compare releases against
+
+The database is filled by main.synthetic (the seed_synthetic command), so
+every run measures the same rows. Two phases:
+
+- endpoints: each endpoint is requested in process, one request at a
+  time, per role, to time it and count its queries
+- mixes: a gunicorn server started with gunicorn.conf.py is loaded over
+  HTTP by concurrent clients, each request drawn from the role's mix
+
+    python -m benchmarks.endpoints [--patients 100000] [--seed 0]
+        [--repeat 200] [--requests 2000] [--concurrency 16] [--workers 2]
+        [--skip-server] [--output FILE] [--baseline FILE] [--threshold 10]
+    python -m benchmarks.endpoints --compare BASELINE RESULTS
+
+Results go to benchmarks/results/<commit>.json unless --output is given.
+With --baseline (or --compare) the latencies, requests per second,
+queries and errors are compared and the exit status is 1 when any
+regressed by more than --threshold percent (queries and errors: by any
+amount). Compare runs from the same machine with the same options only.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.asgi_load import free_port, server_environment, wait_for
+from benchmarks.utils import benchmark_database, percentile, setup_django
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# the synthetic history ends today, so the stats have rows for today
+END_DATE = datetime.date.today()
+
+
+def patients(context, rng):
+    return "/api/v1/patients/"
+
+
+def patients_by_name(context, rng):
+    return f"/api/v1/patient/by-name/?q={rng.choice(context['names'])}"
+
+
+def referrals_info(context, rng):
+    return f"/api/v1/referrals-info/?patient_id={rng.choice(context['patient_ids'])}"
+
+
+def receptionist_stats(context, rng):
+    return "/api/v1/receptionists/stats/"
+
+
+def clinician_stats(context, rng):
+    return "/api/v1/medics/stats/"
+
+
+ENDPOINTS = {
+    "patients": patients,
+    "patient by name": patients_by_name,
+    "referrals info": referrals_info,
+    "receptionist stats": receptionist_stats,
+    "clinician stats": clinician_stats,
+}
+
+# relative share of the requests each role sends to an endpoint
+MIXES = {
+    "receptionist": {
+        "patients": 4,
+        "patient by name": 3,
+        "referrals info": 2,
+        "receptionist stats": 1,
+    },
+    "doctor": {
+        "clinician stats": 3,
+        "referrals info": 3,
+        "patients": 2,
+        "patient by name": 2,
+    },
+}
+
+# lower is better for these, higher for rps
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def seed_database(patients, seed):
+    """Fill the database, returns the request context and a user per role"""
+    from django.db.models import Count
+
+    from main.choices import DOCTOR, RECEPTIONIST
+    from main.models import Patient, User
+    from main.synthetic import FIRST_NAMES, LAST_NAMES, SyntheticData
+
+    SyntheticData(seed=seed, patients=patients, end=END_DATE).generate()
+
+    users = {
+        "receptionist": User.objects.filter(role=RECEPTIONIST).order_by("pk").first(),
+        # the busiest doctor, whose stats count the most rows
+        "doctor": User.objects.filter(role=DOCTOR)
+        .annotate(referrals=Count("doctor_referred_to"))
+        .order_by("-referrals", "pk")
+        .first(),
+    }
+    ids = list(Patient.objects.order_by("pk").values_list("pk", flat=True))
+    context = {
+        "patient_ids": random.Random(seed).sample(ids, min(len(ids), 1000)),
+        "names": FIRST_NAMES + LAST_NAMES,
+    }
+    return context, users
+
+
+def access_tokens(users):
+    from main.serializers import CustomTokenClaimsSerializer
+
+    return {
+        role: str(CustomTokenClaimsSerializer.get_token(user).access_token)
+        for role, user in users.items()
+    }
+
+
+def summarize(timings, duration, errors):
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "rps": len(timings) / duration if duration else 0,
+        "mean_ms": statistics.mean(timings) if timings else 0,
+        "p50_ms": percentile(timings, 50) if timings else 0,
+        "p95_ms": percentile(timings, 95) if timings else 0,
+        "p99_ms": percentile(timings, 99) if timings else 0,
+    }
+
+
+def measure_endpoints(context, tokens, repeat, seed, warmup=10):
+    """Time every endpoint of every role's mix in process, one at a time"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    results = {}
+    for role, mix in MIXES.items():
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens[role]}")
+
+        for name in mix:
+            rng = random.Random(seed)
+            paths = [ENDPOINTS[name](context, rng) for _ in range(warmup + repeat)]
+            for path in paths[:warmup]:
+                client.get(path)
+
+            timings, queries, errors = [], [], 0
+            start = time.perf_counter()
+            for path in paths[warmup:]:
+                with CaptureQueriesContext(connection) as captured:
+                    request_start = time.perf_counter()
+                    response = client.get(path)
+                    elapsed = (time.perf_counter() - request_start) * 1000
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                timings.append(elapsed)
+                queries.append(len(captured.captured_queries))
+            duration = time.perf_counter() - start
+
+            result = summarize(timings, duration, errors)
+            result["queries"] = statistics.mean(queries) if queries else 0
+            results[f"{name} ({role})"] = result
+    return results
+
+
+def start_server(workers, port):
+    environment = server_environment()
+    environment["WEB_CONCURRENCY"] = str(workers)
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "liveup.wsgi",
+        "--config",
+        "gunicorn.conf.py",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--access-logfile",
+        "/dev/null",
+        "--log-level",
+        "warning",
+    ]
+    process = subprocess.Popen(command, env=environment)
+    wait_for(port)
+    return process
+
+
+def load_mix(port, context, token, mix, concurrency, total, seed):
+    """Send total requests drawn from mix with concurrent clients"""
+    timings, errors = [], []
+    lock = threading.Lock()
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=total)
+    paths = iter([ENDPOINTS[name](context, rng) for name in names])
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def client():
+        # one keep-alive connection per client, opened again after errors
+        connection = None
+        while True:
+            with lock:
+                path = next(paths, None)
+            if path is None:
+                break
+            if connection is None:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+                    connection = None
+            except OSError:
+                ok = False
+                connection.close()
+                connection = None
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                (timings if ok else errors).append(elapsed)
+        if connection is not None:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(timings, time.perf_counter() - start, len(errors))
+
+
+def measure_mixes(context, tokens, args):
+    port = free_port()
+    server = start_server(args.workers, port)
+    try:
+        results = {}
+        for role, mix in MIXES.items():
+            # warm up the workers and their caches
+            load_mix(
+                port,
+                context,
+                tokens[role],
+                mix,
+                args.concurrency,
+                args.concurrency * 4,
+                args.seed,
+            )
+            results[role] = load_mix(
+                port,
+                context,
+                tokens[role],
+                mix,
+                args.concurrency,
+                args.requests,
+                args.seed,
+            )
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def metadata(args):
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "options": {
+            name: getattr(args, name)
+            for name in (
+                "patients",
+                "seed",
+                "repeat",
+                "requests",
+                "concurrency",
+                "workers",
+            )
+        },
+    }
+
+
+def compare(baseline, results, threshold):
+    """Print the changes from baseline, returns the regressed metrics"""
+    regressions = []
+    if baseline["meta"]["options"] != results["meta"]["options"]:
+        print("warning: the runs used different options, compare with care")
+
+    print(f"{'case':<40} {'metric':>8} {'baseline':>10} {'current':>10} {'change':>8}")
+    for section in ("endpoints", "mixes"):
+        for case, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(case)
+            if previous is None:
+                continue
+            for metric in (*LATENCY_METRICS, "rps", "queries", "errors"):
+                if metric not in current or metric not in previous:
+                    continue
+                old, new = previous[metric], current[metric]
+                change = (new - old) / old * 100 if old else 0
+                if metric == "queries":
+                    regressed = new > old + 0.01
+                elif metric == "errors":
+                    # failed requests are left out of the timings, which
+                    # could otherwise improve while requests fail
+                    regressed = new > old
+                elif metric == "rps":
+                    regressed = change < -threshold
+                else:
+                    regressed = change > threshold
+                if regressed:
+                    regressions.append(f"{case} {metric}")
+                print(
+                    f"{case:<40} {metric:>8} {old:>10.2f} {new:>10.2f} "
+                    f"{change:>+7.1f}%{'  REGRESSED' if regressed else ''}"
+                )
+    return regressions
+
+
+def check_regressions(baseline, results, threshold):
+    regressions = compare(baseline, results, threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+    print("no regressions")
+
+
+def print_results(results):
+    print(f"commit {results['meta']['commit']}, {results['meta']['options']}")
+    print(
+        f"{'endpoint (role)':<40} {'queries':>8} {'req/s':>8} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+    )
+    for name, result in results["endpoints"].items():
+        print(
+            f"{name:<40} {result['queries']:>8.1f} {result['rps']:>8.1f} "
+            f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['errors']:>7}"
+        )
+    if results.get("mixes"):
+        print(
+            f"{'mix over HTTP (role)':<40} {'':>8} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for role, result in results["mixes"].items():
+            print(
+                f"{role:<40} {'':>8} {result['rps']:>8.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['errors']:>7}"
+            )
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def save_results(results, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument(
+        "--skip-server", action="store_true", help="Only measure in process"
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0)
+    parser.add_argument(
+        "--compare", nargs=2, type=Path, metavar=("BASELINE", "RESULTS")
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        baseline, results = (load_results(path) for path in args.compare)
+        check_regressions(baseline, results, args.threshold)
+        return
+
+    baseline = load_results(args.baseline) if args.baseline else None
+
+    setup_django()
+    with benchmark_database():
+        context, users = seed_database(args.patients, args.seed)
+        tokens = access_tokens(users)
+        results = {
+            "meta": metadata(args),
+            "endpoints": measure_endpoints(context, tokens, args.repeat, args.seed),
+        }
+        if not args.skip_server:
+            results["mixes"] = measure_mixes(context, tokens, args)
+
+    output = args.output or RESULTS_DIR / f"{results['meta']['commit']}.json"
+    save_results(results, output)
+    print_results(results)
+    print(f"saved to {output}")
+
+    if baseline is not None:
+        check_regressions(baseline, results, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare peak Python memory of the unpaginated -info endpoints against the
+streaming export endpoints for growing table sizes
+
+    python -m benchmarks.export [--rows 2000 10000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.utils import benchmark_database, setup_django
+
+
+def peak_memory(client, url, **params):
+    """Peak traced memory in MiB and wall time in ms to read the whole body"""
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    response = client.get(url, params)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert response.status_code == 200, response.status_code
+    return peak / 2**20, elapsed, size / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 10000])
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from benchmarks.stats import seed
+
+    cases = (
+        ("referrals-info", reverse("referral-info-list"), {}),
+        ("referrals export ndjson", reverse("referral-export"), {}),
+        ("referrals export csv", reverse("referral-export"), {"format": "csv"}),
+    )
+
+    print(f"{'rows':>8} {'case':<26} {'peak MiB':>9} {'body MiB':>9} {'time ms':>9}")
+    for rows in args.rows:
+        with benchmark_database():
+            _, doctor = seed(rows)
+            client = APIClient()
+            client.force_authenticate(doctor)
+
+            for name, url, params in cases:
+                peak, elapsed, size = peak_memory(client, url, **params)
+                print(f"{rows:>8} {name:<26} {peak:>9.1f} {size:>9.1f} {elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
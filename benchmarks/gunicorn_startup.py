@@ -0,0 +1,136 @@
+"""
+Startup time and steady-state memory per worker for the gunicorn settings
+in gunicorn.conf.py
+
+Startup is the time from launching gunicorn to the first answered request.
+Memory is read from /proc after the workers served some requests: RSS
+counts pages shared with the master, PSS splits them between the
+processes sharing them, so it shows what preloading saves. Linux only.
+
+    python -m benchmarks.gunicorn_startup [--workers 3] [--requests 300]
+"""
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.asgi_load import free_port
+
+CASES = {
+    "sync": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_PRELOAD": "0"},
+    "sync, preload": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_PRELOAD": "1"},
+    "gthread, preload": {
+        "GUNICORN_WORKER_CLASS": "gthread",
+        "GUNICORN_PRELOAD": "1",
+        "GUNICORN_THREADS": "4",
+    },
+}
+
+# answered with a 401 without touching the database
+PATH = "/api/v1/patients/"
+
+
+def request(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request("GET", PATH, headers={"Connection": "close"})
+        return connection.getresponse().read()
+    finally:
+        connection.close()
+
+
+def wait_for_response(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return request(port)
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError("gunicorn did not answer")
+
+
+def memory_kib(pid):
+    """(RSS, PSS) of a process in KiB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0])
+    return values["Rss"], values["Pss"]
+
+
+def worker_pids(master):
+    with open(f"/proc/{master}/task/{master}/children") as children:
+        return [int(pid) for pid in children.read().split()]
+
+
+def run_case(overrides, workers, requests):
+    port = free_port()
+    environment = dict(os.environ, WEB_CONCURRENCY=str(workers), **overrides)
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "liveup.wsgi",
+        "--config",
+        "gunicorn.conf.py",
+        "--bind",
+        f"127.0.0.1:{port}",
+        "--access-logfile",
+        "/dev/null",
+        "--log-level",
+        "warning",
+    ]
+
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=environment)
+    try:
+        wait_for_response(port)
+        startup = time.perf_counter() - start
+
+        for _ in range(requests):
+            request(port)
+
+        memory = [memory_kib(pid) for pid in worker_pids(server.pid)]
+        return {
+            "startup_s": startup,
+            "workers": len(memory),
+            "rss_mib": statistics.mean(rss for rss, _ in memory) / 1024,
+            "pss_mib": statistics.mean(pss for _, pss in memory) / 1024,
+            "master_rss_mib": memory_kib(server.pid)[0] / 1024,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    results = {
+        name: run_case(overrides, args.workers, args.requests)
+        for name, overrides in CASES.items()
+    }
+
+    print(f"{args.workers} workers, {args.requests} requests before measuring")
+    print(
+        f"{'case':<20} {'startup s':>10} {'workers':>8} {'RSS MiB':>9} "
+        f"{'PSS MiB':>9} {'master MiB':>11}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<20} {result['startup_s']:>10.2f} {result['workers']:>8} "
+            f"{result['rss_mib']:>9.1f} {result['pss_mib']:>9.1f} "
+            f"{result['master_rss_mib']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
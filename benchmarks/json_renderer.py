@@ -0,0 +1,87 @@
+"""
+Encode and decode each endpoint's typical payload with the stdlib and the
+orjson backed JSON renderer and parser
+
+    python -m benchmarks.json_renderer [--rows 500] [--repeat 200]
+"""
+import argparse
+from io import BytesIO
+
+from benchmarks.utils import benchmark_database, measure, setup_django
+
+# (case, url name or path, query params)
+PAYLOADS = (
+    ("patient-list page", "patient-list", {}),
+    ("referral-list page", "referral-list", {}),
+    ("admission-list page", "admission-list", {}),
+    ("prescription-list page", "prescription-list", {}),
+    ("patient timeline page", None, {}),
+    ("referrals-info (all)", "referral-info-list", {}),
+    ("admissions-info (all)", "admission-info-list", {}),
+    ("prescriptions-info (all)", "prescription-info-list", {}),
+    ("medics stats", "/api/v1/medics/stats/", {}),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+
+    from benchmarks.stats import seed
+    from main.counters import rebuild_counters
+    from main.models import Patient
+    from main.parsers import FastJSONParser
+    from main.renderers import FastJSONRenderer
+
+    with benchmark_database():
+        _, doctor = seed(args.rows)
+        rebuild_counters()
+        client = APIClient()
+        client.force_authenticate(doctor)
+
+        # one patient's whole history on a single timeline page
+        patient = Patient.objects.order_by("id").first()
+        timeline_url = reverse("patient-timeline", args=[patient.pk])
+
+        payloads = {}
+        for case, url, params in PAYLOADS:
+            if url is None:
+                url = timeline_url
+            elif not url.startswith("/"):
+                url = reverse(url)
+            response = client.get(url, params)
+            assert response.status_code == 200, response.status_code
+            payloads[case] = response.data
+
+    print(
+        f"{'case':<34} {'KiB':>7} {'encoder':>8} {'mean ms':>9} {'p95 ms':>9} "
+        f"{'MiB/s':>8}"
+    )
+    for case, data in payloads.items():
+        body = JSONRenderer().render(data)
+        size = len(body)
+        for name, renderer, json_parser in (
+            ("stdlib", JSONRenderer(), JSONParser()),
+            ("orjson", FastJSONRenderer(), FastJSONParser()),
+        ):
+            render = measure(lambda: renderer.render(data), args.repeat)
+            parse = measure(lambda: json_parser.parse(BytesIO(body)), args.repeat)
+            for operation, result in (("render", render), ("parse", parse)):
+                throughput = size / 2**20 / (result["mean_ms"] / 1000)
+                print(
+                    f"{case + ' ' + operation:<34} {size / 1024:>7.1f} {name:>8} "
+                    f"{result['mean_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+                    f"{throughput:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compare hyperlinked and compact (?compact=true) responses on the list
+endpoints, one 20 row page each
+
+    python -m benchmarks.serialization [--rows 2000] [--repeat 100]
+"""
+import argparse
+
+from benchmarks.utils import benchmark_database, measure, print_results, setup_django
+
+# (url name or path, role of the user asking, query params)
+ENDPOINTS = (
+    ("patient-list", "doctor", {}),
+    ("registered-patient-list", "receptionist", {}),
+    ("user-list", "doctor", {}),
+    ("referral-list", "doctor", {}),
+    ("assigned-patient-list", "doctor", {}),
+    ("prescription-list", "doctor", {}),
+    ("admission-list", "doctor", {}),
+    ("/api/v1/patient/by-name/", "doctor", {"q": "Patient 1"}),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from benchmarks.stats import seed
+
+    with benchmark_database():
+        receptionist, doctor = seed(args.rows)
+        clients = {}
+        for role, user in (("receptionist", receptionist), ("doctor", doctor)):
+            clients[role] = APIClient()
+            clients[role].force_authenticate(user)
+
+        results = {}
+        for url_name, role, params in ENDPOINTS:
+            url = url_name if url_name.startswith("/") else reverse(url_name)
+            client = clients[role]
+            for mode, extra in (("links", {}), ("compact", {"compact": "true"})):
+
+                def request(params={**params, **extra}):
+                    response = client.get(url, params)
+                    assert response.status_code == 200, response.status_code
+                    response.render()
+
+                results[f"{url_name} ({mode})"] = measure(request, args.repeat)
+
+    print_results(f"List endpoints, {args.rows} rows per table", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Compare the counter-backed stats helpers against the original
+one-COUNT-per-number implementation
+
+    python -m benchmarks.stats [--rows 20000] [--repeat 200]
+"""
+import argparse
+import datetime
+import random
+from types import SimpleNamespace
+
+from benchmarks.utils import benchmark_database, measure, print_results, setup_django
+
+
+def legacy_receptionist_stats(request):
+    from django.utils import timezone
+    from main.models import Patient, Referral
+
+    today = timezone.now().date()
+    return {
+        "referrals": Referral.objects.all().count(),
+        "referrals_by_user": Referral.objects.filter(created_by=request.user).count(),
+        "referrals_today_by_user": Referral.objects.filter(
+            created_by=request.user, created_at__date=today
+        ).count(),
+        "patients": Patient.objects.all().count(),
+        "patients_by_user": Patient.objects.filter(created_by=request.user).count(),
+        "patients_today_by_user": Patient.objects.filter(
+            created_by=request.user, created_at__date=today
+        ).count(),
+    }
+
+
+def legacy_clinician_stats(request):
+    from django.utils import timezone
+    from main.models import Admission, Prescription, Referral
+
+    today = timezone.now().date()
+    stats = {
+        "referrals": Referral.objects.all().count(),
+        "referrals_to_user": Referral.objects.filter(doctor=request.user).count(),
+        "referrals_today_to_user": Referral.objects.filter(
+            doctor=request.user, created_at__date=today
+        ).count(),
+    }
+    for name, model in (("admissions", Admission), ("prescriptions", Prescription)):
+        stats[name] = model.objects.all().count()
+        stats[f"{name}_by_user"] = model.objects.filter(created_by=request.user).count()
+        stats[f"{name}_today_by_user"] = model.objects.filter(
+            created_by=request.user, created_at__date=today
+        ).count()
+    return stats
+
+
+def seed(rows):
+    from django.utils import timezone
+    from main.choices import DOCTOR, RECEPTIONIST
+    from main.models import Admission, Patient, Prescription, Referral, User, Ward
+
+    rng = random.Random(0)
+    receptionists = [
+        User.objects.create_user(
+            email=f"receptionist{i}@liveup.test",
+            username=f"receptionist{i}",
+            password="benchmark",
+            role=RECEPTIONIST,
+        )
+        for i in range(10)
+    ]
+    doctors = [
+        User.objects.create_user(
+            email=f"doctor{i}@liveup.test",
+            username=f"doctor{i}",
+            password="benchmark",
+            role=DOCTOR,
+        )
+        for i in range(10)
+    ]
+    ward = Ward.objects.create(name="General", created_by=doctors[0])
+
+    Patient.objects.bulk_create(
+        Patient(
+            patient_name=f"Patient {i}",
+            next_of_kin="Next of kin",
+            address="Kampala",
+            date_of_birth=datetime.date(1990, 1, 1),
+            age=30,
+            contacts="+256 774 332 423",
+            created_by=rng.choice(receptionists),
+        )
+        for i in range(rows)
+    )
+    patients = list(Patient.objects.values_list("id", flat=True))
+    now = timezone.now()
+
+    Referral.objects.bulk_create(
+        Referral(
+            patient_id=rng.choice(patients),
+            doctor=rng.choice(doctors),
+            created_by=rng.choice(receptionists),
+        )
+        for _ in range(rows)
+    )
+    Admission.objects.bulk_create(
+        Admission(
+            patient_id=rng.choice(patients), ward=ward, created_by=rng.choice(doctors)
+        )
+        for _ in range(rows)
+    )
+    Prescription.objects.bulk_create(
+        Prescription(
+            patient_id=rng.choice(patients),
+            start_datetime=now,
+            end_datetime=now,
+            description="Take two tablets every morning",
+            created_by=rng.choice(doctors),
+        )
+        for _ in range(rows)
+    )
+    return receptionists[0], doctors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from main.view_helpers import (
+        generate_clinician_stats,
+        generate_receptionist_stats,
+    )
+
+    from main.counters import rebuild_counters
+
+    with benchmark_database():
+        receptionist, doctor = seed(args.rows)
+        # bulk_create does not send the signals which maintain the counters
+        rebuild_counters()
+        receptionist_request = SimpleNamespace(user=receptionist)
+        doctor_request = SimpleNamespace(user=doctor)
+
+        assert legacy_receptionist_stats(
+            receptionist_request
+        ) == generate_receptionist_stats(receptionist_request)
+        assert legacy_clinician_stats(doctor_request) == generate_clinician_stats(
+            doctor_request
+        )
+
+        results = {
+            "receptionist stats (legacy)": measure(
+                lambda: legacy_receptionist_stats(receptionist_request), args.repeat
+            ),
+            "receptionist stats": measure(
+                lambda: generate_receptionist_stats(receptionist_request), args.repeat
+            ),
+            "clinician stats (legacy)": measure(
+                lambda: legacy_clinician_stats(doctor_request), args.repeat
+            ),
+            "clinician stats": measure(
+                lambda: generate_clinician_stats(doctor_request), args.repeat
+            ),
+        }
+
+    print_results(f"Stats helpers, {args.rows} rows per table", results)
+
+
+if __name__ == "__main__":
+    main()
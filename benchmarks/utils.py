@@ -0,0 +1,83 @@
+"""
+Helpers shared by the benchmark scripts
+
+Benchmarks run against a throwaway database created the same way the
+test runner creates one, so they never touch the configured database.
+Run them from the project root, e.g. `python -m benchmarks.stats`
+"""
+import contextlib
+import os
+import statistics
+import time
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "liveup.settings")
+
+    import django
+
+    django.setup()
+
+
+@contextlib.contextmanager
+def benchmark_database():
+    from django.test.utils import (
+        setup_databases,
+        setup_test_environment,
+        teardown_databases,
+        teardown_test_environment,
+    )
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(func, repeat=200, warmup=10):
+    """Time func and count the queries it sends on every call"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(context.captured_queries))
+
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        "queries": statistics.mean(queries),
+    }
+
+
+def print_results(title, results):
+    print(title)
+    print(
+        f"{'case':<40} {'queries':>8} {'mean ms':>9} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<40} {result['queries']:>8.1f} {result['mean_ms']:>9.3f} "
+            f"{result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} "
+            f"{result['p99_ms']:>9.3f}"
+        )
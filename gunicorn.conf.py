@@ -0,0 +1,88 @@
+"""
+gunicorn settings, read from the environment
+
+    GUNICORN_WORKER_CLASS  sync (default) or gthread
+    WEB_CONCURRENCY        workers, set by Heroku for the dyno size;
+                           defaults to a count derived from the CPUs
+    GUNICORN_THREADS       threads per gthread worker (default 4)
+    DB_MAX_CONNECTIONS     connections the database plan allows (default 20)
+    DB_RESERVED_CONNECTIONS  kept free for the release phase, the job
+                           worker and psql sessions (default 4)
+    WEB_DYNOS              web dynos sharing the database (default 1)
+    GUNICORN_PRELOAD       import the app once before forking (default 1)
+    GUNICORN_MAX_REQUESTS  requests a worker serves before it is replaced,
+                           which bounds memory growth (default 1000, 0 = never)
+
+Every thread holds its own database connection, so workers * threads is
+capped by the connections left to each dyno.
+"""
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+
+def worker_budget(worker_class, threads, cpus):
+    """Workers for this dyno, limited by the database connections"""
+    if worker_class == "gthread":
+        # threads overlap the time spent waiting on the database
+        wanted = cpus + 1
+    else:
+        wanted = 2 * cpus + 1
+    wanted = env_int("WEB_CONCURRENCY", wanted)
+
+    connections = env_int("DB_MAX_CONNECTIONS", 20) - env_int(
+        "DB_RESERVED_CONNECTIONS", 4
+    )
+    per_dyno = connections // env_int("WEB_DYNOS", 1)
+    return max(1, min(wanted, per_dyno // threads))
+
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+threads = env_int("GUNICORN_THREADS", 4) if worker_class == "gthread" else 1
+workers = worker_budget(worker_class, threads, multiprocessing.cpu_count())
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+max_requests = env_int("GUNICORN_MAX_REQUESTS", 1000)
+# stop the workers from restarting all at once
+max_requests_jitter = max_requests // 10
+
+# Heroku's router drops requests after 30 seconds
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+
+# heartbeat files on a tmpfs so a slow disk cannot stall the workers
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+
+    # Import the URLconf, and with it every view, serializer and the
+    # admin, once in the master so the workers share those pages
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+
+def pre_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+
+    # connections must not be shared with the workers
+    from django.db import connections
+
+    from liveup.db.pool import close_pools
+
+    connections.close_all()
+    # with DB_POOL closing only returned them to the pool
+    close_pools()
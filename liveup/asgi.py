@@ -9,8 +9,69 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liveup.settings')
+# see the CONN_MAX_AGE override in settings
+os.environ.setdefault('ASGI', '1')
 
-application = get_asgi_application()
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django 3.2 iterates streaming responses on the event loop, where the
+    database cannot be queried, e.g by the exports' lazy querysets. Each
+    part is produced on the request's thread instead, one at a time.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        # as ASGIHandler.send_response does
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append(
+                (b'Set-Cookie', c.output(header='').encode('ascii').strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+        parts = iter(response)
+        # StopIteration cannot be raised through a future
+        next_part = sync_to_async(lambda: next(parts, None), thread_sensitive=True)
+        while True:
+            part = await next_part()
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+# as django.core.asgi.get_asgi_application does
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+
+async def application(scope, receive, send):
+    # Django 3.2 runs the sync parts of every request (middleware, sync
+    # views, ORM calls) on one shared thread. A context per request gives
+    # each request a thread of its own, as Django 4.0 does.
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -0,0 +1,225 @@
+"""
+Thread safe pool of DB-API connections shared by a process
+
+Connections are checked out when Django connects and returned when it
+closes, e.g at the end of every request, so a worker's threads share at
+most MAX_SIZE connections. A connection is pinged before it is handed out
+so one killed by a failover or an idle timeout is replaced instead of
+failing the request. The first checkout in a process, e.g a gunicorn
+worker, opens MIN_SIZE connections.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MIN_SIZE": 0,
+    "MAX_SIZE": 10,
+    # seconds to wait for a free connection
+    "TIMEOUT": 10.0,
+    # seconds after which a connection is replaced, 0 for never
+    "MAX_LIFETIME": 3600,
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, ping, reset, options=None):
+        """
+        connect() opens a connection, ping(connection) raises when it is
+        dead and reset(connection) returns it to a clean state
+        """
+        options = {**DEFAULTS, **(options or {})}
+        self.min_size = options["MIN_SIZE"]
+        self.max_size = options["MAX_SIZE"]
+        self.timeout = options["TIMEOUT"]
+        self.max_lifetime = options["MAX_LIFETIME"]
+        self._connect = connect
+        self._ping = ping
+        self._reset = reset
+
+        self._lock = threading.Condition(threading.RLock())
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        # (connection, opened at)
+        self._idle = collections.deque()
+        self._opened_at = {}
+        self._in_use = 0
+        self.counters = collections.Counter()
+        # whether fill() ran in this process, close() stops it from running
+        self._filled = False
+        self._closed = False
+
+    def _check_fork(self):
+        # connections opened before a fork belong to the parent, closing
+        # them here would end the parent's sessions
+        if self._pid != os.getpid():
+            self._start()
+
+    @property
+    def size(self):
+        return len(self._idle) + self._in_use
+
+    def stats(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                **self.counters,
+            }
+
+    def fill(self):
+        """Open connections until MIN_SIZE are open"""
+        while True:
+            with self._lock:
+                self._check_fork()
+                self._filled = True
+                if self._closed or self.size >= self.min_size:
+                    return
+                self._in_use += 1
+            try:
+                connection = self._open()
+            except BaseException:
+                with self._lock:
+                    self._in_use -= 1
+                    self._lock.notify()
+                raise
+            self.putconn(connection)
+
+    def getconn(self):
+        with self._lock:
+            self._check_fork()
+            filled = self._filled
+        if not filled:
+            self.fill()
+
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            self._check_fork()
+            self.counters["checkouts"] += 1
+            waited = False
+            while not self._idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    logger.warning("Connection pool exhausted: %s", self.counters)
+                    raise PoolTimeout(
+                        f"No database connection free after {self.timeout}s "
+                        f"({self.max_size} in use)"
+                    )
+                if not waited:
+                    waited = True
+                    self.counters["waits"] += 1
+                self._lock.wait(remaining)
+
+            connection = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            if connection is not None:
+                connection = self._check(connection)
+            if connection is None:
+                connection = self._open()
+        except BaseException:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        return connection
+
+    def putconn(self, connection):
+        try:
+            healthy = not self._expired(connection) and self._reset(connection)
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if healthy:
+                self._idle.append(connection)
+            else:
+                self._discard(connection)
+            self._lock.notify()
+
+    def close(self):
+        """Close the idle connections, checked out ones close when returned"""
+        with self._lock:
+            self._check_fork()
+            while self._idle:
+                self._discard(self._idle.pop())
+            # e.g in the gunicorn master, the workers fill pools of their own
+            self._closed = True
+
+    def _open(self):
+        connection = self._connect()
+        with self._lock:
+            self._opened_at[id(connection)] = time.monotonic()
+            self.counters["opened"] += 1
+        return connection
+
+    def _check(self, connection):
+        """The connection if it still works, None otherwise"""
+        if self._expired(connection):
+            self._discard(connection)
+            return None
+        try:
+            self._ping(connection)
+        except Exception:
+            with self._lock:
+                self.counters["failed_pings"] += 1
+            self._discard(connection)
+            return None
+        return connection
+
+    def _expired(self, connection):
+        opened_at = self._opened_at.get(id(connection), 0)
+        return (
+            self.max_lifetime > 0 and time.monotonic() - opened_at > self.max_lifetime
+        )
+
+    def _discard(self, connection):
+        # the lock is reentrant, callers may hold it
+        with self._lock:
+            self._opened_at.pop(id(connection), None)
+            self.counters["closed"] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+# {key: ConnectionPool}
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory):
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def all_pools():
+    with _pools_lock:
+        return dict(_pools)
+
+
+def close_pools(predicate=None):
+    """Close the idle connections of every pool, or those matching predicate"""
+    for key, pool in all_pools().items():
+        if predicate is None or predicate(key):
+            pool.close()
@@ -0,0 +1,87 @@
+"""
+PostgreSQL backend drawing its connections from liveup.db.pool
+
+    DATABASES["default"]["ENGINE"] = "liveup.db.pooled_postgresql"
+    DATABASES["default"]["POOL"] = {"MIN_SIZE": 2, "MAX_SIZE": 10}
+
+See liveup.db.pool.DEFAULTS for the POOL options. Use it with
+CONN_MAX_AGE = 0 so connections go back to the pool after every request.
+"""
+import psycopg2
+import psycopg2.extras
+from django.db import DatabaseError
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresWrapper
+from psycopg2 import extensions
+
+from liveup.db.pool import ConnectionPool, PoolTimeout, get_pool
+from liveup.db.pooled_postgresql.creation import DatabaseCreation
+
+
+def connect(conn_params):
+    connection = psycopg2.connect(**conn_params)
+    # as PostgresWrapper.get_new_connection does
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    if not connection.autocommit:
+        connection.rollback()
+
+
+def reset(connection):
+    """Roll back what the last user left behind, False if it is unusable"""
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status == extensions.TRANSACTION_STATUS_IDLE:
+        return True
+
+    if connection.autocommit:
+        # rollback() does nothing in autocommit mode, e.g after a raw BEGIN
+        with connection.cursor() as cursor:
+            cursor.execute("ROLLBACK")
+    else:
+        connection.rollback()
+    return True
+
+
+class DatabaseWrapper(PostgresWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params):
+        key = tuple(sorted((name, str(value)) for name, value in conn_params.items()))
+        return get_pool(
+            key,
+            lambda: ConnectionPool(
+                lambda: connect(conn_params),
+                ping,
+                reset,
+                self.settings_dict.get("POOL"),
+            ),
+        )
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        try:
+            connection = self.pool.getconn()
+        except PoolTimeout as exc:
+            raise DatabaseError(str(exc)) from exc
+
+        # as PostgresWrapper.get_new_connection does
+        options = self.settings_dict["OPTIONS"]
+        self.isolation_level = options.get(
+            "isolation_level", connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
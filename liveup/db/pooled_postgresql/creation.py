@@ -0,0 +1,15 @@
+from django.db.backends.postgresql.creation import (
+    DatabaseCreation as PostgresCreation,
+)
+
+from liveup.db.pool import close_pools
+
+
+class DatabaseCreation(PostgresCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # idle pooled connections would keep the database in use
+        close_pools(
+            lambda key: ("database", test_database_name) in key
+            or ("dbname", test_database_name) in key
+        )
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,62 @@
+"""
+Sends the reads of some safe requests to a replica
+
+Views opt in with main.mixins.ReplicaReadMixin, which picks one of
+DATABASE_REPLICAS for the rest of the request. Everything else, and all
+writes, go to the primary. Replicas lag behind the primary, so a user who
+wrote reads from the primary for REPLICA_PIN_SECONDS afterwards, see
+main.middleware.ReplicaPinMiddleware. The pins live in the default cache,
+which must be shared by the processes (CACHE_URL) for them to apply
+across workers.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRIMARY = "default"
+
+# alias of the replica the current request reads from, None for the primary
+_read_database = ContextVar("read_database", default=None)
+
+
+def use_replica(alias):
+    _read_database.set(alias)
+
+
+def choose_replica():
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def pin_key(user_id):
+    return f"replica:pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(pin_key(user_id), False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        # also for instances which were read from a replica
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas follow the primary's schema
+        return db not in settings.DATABASE_REPLICAS
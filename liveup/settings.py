@@ -15,6 +15,8 @@ import environ
 import os
 from datetime import timedelta
 
+from django.core.exceptions import ImproperlyConfigured
+
 env = environ.Env(DEBUG=(bool, False))
 import django_heroku
 
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "main.apps.MainConfig",
     "phonenumber_field",
     "rest_framework",
@@ -57,6 +60,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "main.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -64,6 +68,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "main.middleware.ReplicaPinMiddleware",
 ]
 
 ROOT_URLCONF = "liveup.urls"
@@ -158,7 +163,73 @@ USE_TZ = True
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATIC_URL = "/static/"
+# also adds WhiteNoise with CompressedManifestStaticFilesStorage, which
+# writes gzip and (with Brotli installed) brotli copies at collectstatic.
+# Hashed files are cached forever, WHITENOISE_MAX_AGE covers the rest
 django_heroku.settings(locals())
+WHITENOISE_MAX_AGE = 0 if DEBUG else env.int("WHITENOISE_MAX_AGE", default=86400)
+
+# Under ASGI each request runs on a thread of its own which ends with it,
+# see liveup/asgi.py, so persistent connections would be left open
+if env.bool("ASGI", default=False):
+    for database in DATABASES.values():
+        database["CONN_MAX_AGE"] = 0
+
+# Share a pool of connections between the threads of a process, see
+# liveup.db.pool. Connections go back to the pool after every request.
+if env.bool("DB_POOL", default=False):
+    DATABASES["default"].update(
+        ENGINE="liveup.db.pooled_postgresql",
+        CONN_MAX_AGE=0,
+        POOL={
+            "MIN_SIZE": env.int("DB_POOL_MIN_SIZE", default=0),
+            "MAX_SIZE": env.int("DB_POOL_MAX_SIZE", default=10),
+            "TIMEOUT": env.float("DB_POOL_TIMEOUT", default=10.0),
+            "MAX_LIFETIME": env.int("DB_POOL_MAX_LIFETIME", default=3600),
+        },
+    )
+
+# Read replicas for the views using main.mixins.ReplicaReadMixin, see
+# liveup.db.routers, e.g DATABASE_REPLICA_URLS=postgres://...,postgres://...
+# Set up like the primary. Needs a shared CACHE_URL, see below. Leave it
+# unset for the tests, which stand in the primary for a replica where they
+# need one.
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), start=1):
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        **dj_database_url.parse(url),
+        "ENGINE": DATABASES["default"]["ENGINE"],
+        "CONN_MAX_AGE": DATABASES["default"].get("CONN_MAX_AGE", 0),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["liveup.db.routers.ReplicaRouter"]
+# How long a user who wrote reads from the primary
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=5)
+
+# e.g rediscache://... or pymemcache://... to share the cache between
+# processes, which the replica pins and user status cache rely on
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+# A pin kept in a cache of the worker's own would not hold on the others,
+# so users would read their writes back from a lagging replica
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+if DATABASE_REPLICAS and CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHES:
+    raise ImproperlyConfigured(
+        "DATABASE_REPLICA_URLS needs a CACHE_URL shared by the processes, "
+        "e.g rediscache://..., so users who wrote keep reading from the primary"
+    )
+
+# API responses, see main.middleware.CompressionMiddleware
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=1024)
+COMPRESSION_ENCODINGS = env.list("COMPRESSION_ENCODINGS", default=["br", "gzip"])
+COMPRESSION_GZIP_LEVEL = env.int("COMPRESSION_GZIP_LEVEL", default=6)
+COMPRESSION_BROTLI_QUALITY = env.int("COMPRESSION_BROTLI_QUALITY", default=5)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -175,6 +246,16 @@ AUTH_USER_MODEL = "main.User"
 
 REST_USE_JWT = True
 
+# How long a user's is_active and role are trusted before a token built
+# user is checked again, see main.authentication
+JWT_USER_STATUS_TTL = env.int("JWT_USER_STATUS_TTL", default=60)
+
+# Reference lists are only cached in a cache the processes share, in one
+# of their own a write would not reach the other workers' lists
+REFERENCE_CACHE = env.bool("REFERENCE_CACHE", default="CACHE_URL" in os.environ)
+# Upper bound on how long a cached reference list is kept, see main.reference
+REFERENCE_CACHE_TTL = env.int("REFERENCE_CACHE_TTL", default=24 * 60 * 60)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=48),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=3),
@@ -182,7 +263,20 @@ SIMPLE_JWT = {
 }
 
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": ("dj_rest_auth.jwt_auth.JWTAuthentication",),
+    "DEFAULT_AUTHENTICATION_CLASSES": (
+        "main.authentication.StatelessJWTAuthentication",
+    ),
+    # orjson backed, swap in rest_framework.renderers.JSONRenderer and
+    # rest_framework.parsers.JSONParser for the stdlib ones
+    "DEFAULT_RENDERER_CLASSES": (
+        "main.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "main.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 20,
 }
@@ -199,6 +293,7 @@ CORS_ALLOW_ALL_ORIGINS = True
 FROM_EMAIL = env("FROM_EMAIL")
 
 REST_AUTH_SERIALIZERS = {
+    "JWT_TOKEN_CLAIMS_SERIALIZER": "main.serializers.CustomTokenClaimsSerializer",
     "USER_DETAILS_SERIALIZER": "main.serializers.CustomUserDetailsSerializer",
     "PASSWORD_RESET_SERIALIZER": "main.serializers.CustomPasswordResetSerializer",
 }
@@ -209,3 +304,16 @@ EMAIL_HOST = "smtp.gmail.com"
 EMAIL_HOST_USER = env("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = env("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = 587
+
+# OpenAPI documents, see main.schema. Rebuilt when the sources in
+# SCHEMA_SOURCE_DIRS change
+SCHEMA_CACHE_DIR = env("SCHEMA_CACHE_DIR", default=os.path.join(BASE_DIR, "schema"))
+SCHEMA_SOURCE_DIRS = ["main", "liveup"]
+
+# Background jobs, see main.jobs
+JOB_MAX_ATTEMPTS = env.int("JOB_MAX_ATTEMPTS", default=5)
+JOB_RETRY_BACKOFF = env.int("JOB_RETRY_BACKOFF", default=30)
+JOB_MAX_BACKOFF = env.int("JOB_MAX_BACKOFF", default=3600)
+JOB_TIMEOUT = env.int("JOB_TIMEOUT", default=600)
+# seconds finished jobs are kept before run_jobs deletes them
+JOB_RETENTION = env.int("JOB_RETENTION", default=7 * 24 * 60 * 60)
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.utils import timezone
 
-from main.models import Admission, Patient, Prescription, Referral, User, Ward
+from main.models import Admission, Job, Patient, Prescription, Referral, User, Ward
 from .forms import CustomUserChangeForm, CustomUserCreationForm
 
 
@@ -62,9 +63,27 @@ class CustomUserAdmin(UserAdmin):
     )
 
 
+class TrackedChangesAdmin(admin.ModelAdmin):
+    """Record who changed a row and when, like the API does"""
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.updated_at = timezone.now()
+            obj.updated_by = request.user
+        super().save_model(request, obj, form, change)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "attempts", "run_at", "created_at"]
+    list_filter = ["status", "name"]
+    # payloads may carry personal data, e.g the body of a queued email
+    exclude = ["payload"]
+
+
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(Patient)
-admin.site.register(Prescription)
-admin.site.register(Ward)
-admin.site.register(Admission)
-admin.site.register(Referral)
+admin.site.register(Patient, TrackedChangesAdmin)
+admin.site.register(Prescription, TrackedChangesAdmin)
+admin.site.register(Ward, TrackedChangesAdmin)
+admin.site.register(Admission, TrackedChangesAdmin)
+admin.site.register(Referral, TrackedChangesAdmin)
+admin.site.register(Job, JobAdmin)
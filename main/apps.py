@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main"
+
+    def ready(self):
+        # connects the stats counter, user status and reference list signals
+        import main.authentication  # noqa: F401
+        import main.counters  # noqa: F401
+        import main.reference  # noqa: F401
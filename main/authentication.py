@@ -0,0 +1,114 @@
+"""
+Stateless JWT authentication
+
+Access tokens carry the user's role and names as claims, see
+CustomTokenClaimsSerializer. Safe requests are authenticated with a
+ClaimsUser built from those claims instead of loading the User row; writes
+still load it since they store it on the rows they create or update.
+
+A revoked user (deactivated, deleted or given another role) could keep
+using a token until it expires, so the user's is_active and role are
+checked against a cache kept for JWT_USER_STATUS_TTL seconds, which is
+dropped when the user is saved or deleted in this process.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+from main.models import User
+
+# User fields copied into the tokens
+TOKEN_USER_CLAIMS = ("role", "username", "email", "first_name", "last_name")
+
+
+def user_status_key(user_id):
+    return f"auth:user-status:{user_id}"
+
+
+def get_user_status(user_id):
+    """(is_active, role) of the user, (False, None) when it does not exist"""
+    key = user_status_key(user_id)
+    status = cache.get(key)
+    if status is None:
+        row = User.objects.filter(pk=user_id).values_list("is_active", "role").first()
+        status = tuple(row) if row is not None else (False, None)
+        cache.set(key, status, settings.JWT_USER_STATUS_TTL)
+    return status
+
+
+class ClaimsUser(TokenUser):
+    """
+    User built from the token claims
+    Any other User attribute is read from the User row, loaded on first use
+    """
+
+    @cached_property
+    def role(self):
+        return self.token["role"]
+
+    @cached_property
+    def email(self):
+        return self.token["email"]
+
+    @cached_property
+    def first_name(self):
+        return self.token["first_name"]
+
+    @cached_property
+    def last_name(self):
+        return self.token["last_name"]
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.pk)
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name == "token":
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        # tokens issued before the claims were added load the user
+        if request.method in SAFE_METHODS and all(
+            claim in validated_token for claim in TOKEN_USER_CLAIMS
+        ):
+            return self.get_claims_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_claims_user(self, validated_token):
+        user = ClaimsUser(validated_token)
+        is_active, role = get_user_status(user.pk)
+
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if role != user.role:
+            raise AuthenticationFailed(
+                _("Token is out of date, log in again"), code="token_outdated"
+            )
+        return user
+
+
+def user_status_changed(sender, instance, **kwargs):
+    cache.delete(user_status_key(instance.pk))
+
+
+post_save.connect(user_status_changed, sender=User)
+post_delete.connect(user_status_changed, sender=User)
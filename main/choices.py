@@ -25,3 +25,17 @@ REFERAL_STATUS = (
     (NOT_SEEN, NOT_SEEN),
     (IN_PROGRESS, IN_PROGRESS),
 )
+
+# CHOICES FOR JOB MODEL
+
+JOB_PENDING = "Pending"
+JOB_RUNNING = "Running"
+JOB_DONE = "Done"
+JOB_FAILED = "Failed"
+
+JOB_STATUS = (
+    (JOB_PENDING, JOB_PENDING),
+    (JOB_RUNNING, JOB_RUNNING),
+    (JOB_DONE, JOB_DONE),
+    (JOB_FAILED, JOB_FAILED),
+)
@@ -0,0 +1,230 @@
+"""
+Incrementally maintained counters behind the stats endpoints
+
+Creating, reassigning or deleting a tracked row adjusts the matching
+StatCounter rows so the stats views read a handful of rows instead of
+counting the source tables. reconcile_stats rebuilds the counters from the
+source tables and reports any drift, e.g after loaddata or bulk updates
+which do not send signals. It counts every tracked table, so run it when
+needed rather than on every deploy.
+"""
+import datetime
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from main.models import Admission, Patient, Prescription, Referral, StatCounter
+
+# A counter per user is also kept per user per day under daily_name
+TrackedCounter = namedtuple(
+    "TrackedCounter", ["name", "user_field", "daily_name"], defaults=[None, None]
+)
+
+TRACKED_COUNTERS = {
+    Patient: (
+        TrackedCounter("patients"),
+        TrackedCounter("patients_by_user", "created_by", "patients_today_by_user"),
+    ),
+    Referral: (
+        TrackedCounter("referrals"),
+        TrackedCounter("referrals_by_user", "created_by", "referrals_today_by_user"),
+        TrackedCounter("referrals_to_user", "doctor", "referrals_today_to_user"),
+    ),
+    Admission: (
+        TrackedCounter("admissions"),
+        TrackedCounter("admissions_by_user", "created_by", "admissions_today_by_user"),
+    ),
+    Prescription: (
+        TrackedCounter("prescriptions"),
+        TrackedCounter(
+            "prescriptions_by_user", "created_by", "prescriptions_today_by_user"
+        ),
+    ),
+}
+
+
+def counter_keys(instance):
+    """The (name, user_id, day) of every counter the instance is counted in"""
+    for counter in TRACKED_COUNTERS[type(instance)]:
+        if counter.user_field is None:
+            yield (counter.name, None, None)
+            continue
+
+        user_id = getattr(instance, f"{counter.user_field}_id")
+        if user_id is None:
+            continue
+
+        yield (counter.name, user_id, None)
+        yield (counter.daily_name, user_id, timezone.localdate(instance.created_at))
+
+
+def _sort_key(item):
+    (name, user_id, day), _ = item
+    return (name, user_id or 0, day or datetime.date.min)
+
+
+def update_counters(deltas):
+    """
+    Apply {(name, user_id, day): delta} in one transaction
+    Rows are locked in a stable order so concurrent writers cannot deadlock
+    """
+    with transaction.atomic():
+        for (name, user_id, day), delta in sorted(deltas.items(), key=_sort_key):
+            if not delta:
+                continue
+
+            counters = StatCounter.objects.filter(name=name, user_id=user_id, day=day)
+            if counters.update(value=F("value") + delta):
+                continue
+
+            try:
+                with transaction.atomic():
+                    StatCounter.objects.create(
+                        name=name, user_id=user_id, day=day, value=delta
+                    )
+            except IntegrityError:
+                # another writer created the row first
+                counters.update(value=F("value") + delta)
+
+
+def track_created(instances):
+    """Count rows inserted without signals, e.g by bulk_create"""
+    deltas = Counter()
+    for instance in instances:
+        deltas.update(counter_keys(instance))
+    update_counters(deltas)
+
+
+def read_counters(user_id):
+    """Global counters and the user's counters for all time and today"""
+    today = timezone.localdate()
+    rows = StatCounter.objects.filter(
+        Q(user__isnull=True, day__isnull=True)
+        | Q(user=user_id, day__isnull=True)
+        | Q(user=user_id, day=today)
+    ).values_list("name", "value")
+
+    counts = defaultdict(int)
+    counts.update(rows)
+    return counts
+
+
+def counters_pre_save(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None:
+        return
+
+    previous = sender.objects.filter(pk=instance.pk).first()
+    instance._previous_counter_keys = (
+        list(counter_keys(previous)) if previous is not None else None
+    )
+
+
+def counters_post_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+
+    deltas = Counter()
+    if created:
+        deltas.update(counter_keys(instance))
+    else:
+        previous_keys = getattr(instance, "_previous_counter_keys", None)
+        if previous_keys is None:
+            return
+        deltas.update(counter_keys(instance))
+        deltas.subtract(previous_keys)
+
+    update_counters(deltas)
+
+
+def counters_post_delete(sender, instance, **kwargs):
+    deltas = Counter()
+    deltas.subtract(counter_keys(instance))
+    update_counters(deltas)
+
+
+def expected_counters():
+    """Count every tracked counter from the source tables"""
+    expected = {}
+    for model, counters in TRACKED_COUNTERS.items():
+        for counter in counters:
+            if counter.user_field is None:
+                expected[(counter.name, None, None)] = model.objects.count()
+                continue
+
+            rows = model.objects.filter(
+                **{f"{counter.user_field}__isnull": False}
+            ).order_by()
+            for row in rows.values(counter.user_field).annotate(count=Count("id")):
+                key = (counter.name, row[counter.user_field], None)
+                expected[key] = row["count"]
+
+            daily_rows = rows.values(
+                counter.user_field, created_on=TruncDate("created_at")
+            ).annotate(count=Count("id"))
+            for row in daily_rows:
+                key = (counter.daily_name, row[counter.user_field], row["created_on"])
+                expected[key] = row["count"]
+
+    return expected
+
+
+def find_drift(expected=None):
+    """
+    Counters whose stored value differs from the source tables
+    as {(name, user_id, day): (stored, expected)}
+    """
+    if expected is None:
+        expected = expected_counters()
+
+    stored = {
+        (name, user_id, day): value
+        for name, user_id, day, value in StatCounter.objects.values_list(
+            "name", "user_id", "day", "value"
+        )
+    }
+
+    drift = {}
+    for key in stored.keys() | expected.keys():
+        if stored.get(key, 0) != expected.get(key, 0):
+            drift[key] = (stored.get(key, 0), expected.get(key, 0))
+    return drift
+
+
+def rebuild_counters():
+    """
+    Set every counter to the count of the source tables, returns the drift
+    that was fixed as find_drift() does
+
+    The counter table is locked for the whole rebuild: writers which
+    already changed a counter are waited for, so they are counted, and the
+    rest wait until the rebuilt values are committed, so no change is lost.
+    Stats reads go on meanwhile. Only drifted counters are written.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "LOCK TABLE {} IN EXCLUSIVE MODE".format(
+                    connection.ops.quote_name(StatCounter._meta.db_table)
+                )
+            )
+        drift = find_drift()
+
+        for (name, user_id, day), (_, value) in sorted(drift.items(), key=_sort_key):
+            counters = StatCounter.objects.filter(name=name, user_id=user_id, day=day)
+            if not value:
+                counters.delete()
+            elif not counters.update(value=value):
+                StatCounter.objects.create(
+                    name=name, user_id=user_id, day=day, value=value
+                )
+    return drift
+
+
+for tracked_model in TRACKED_COUNTERS:
+    pre_save.connect(counters_pre_save, sender=tracked_model)
+    post_save.connect(counters_post_save, sender=tracked_model)
+    post_delete.connect(counters_post_delete, sender=tracked_model)
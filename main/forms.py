@@ -1,4 +1,10 @@
-from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from django.contrib.auth.forms import (
+    PasswordResetForm,
+    UserChangeForm,
+    UserCreationForm,
+)
+
+from main.jobs import enqueue_password_reset
 from main.models import User
 
 
@@ -12,3 +18,28 @@ class CustomUserChangeForm(UserChangeForm):
     class Meta(UserChangeForm.Meta):
         model = User
         fields = UserChangeForm.Meta.fields
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """
+    Queues the reset email instead of sending it during the request
+    The reset link is built by the job, so it is never stored
+    """
+
+    def send_mail(
+        self,
+        subject_template_name,
+        email_template_name,
+        context,
+        from_email,
+        to_email,
+        html_email_template_name=None,
+    ):
+        enqueue_password_reset(
+            context["user"],
+            context,
+            subject_template_name,
+            email_template_name,
+            from_email,
+            html_email_template_name,
+        )
@@ -0,0 +1,264 @@
+"""
+Database backed job queue for slow side effects, e.g sending email
+
+enqueue() stores a Job row and returns at once; `manage.py run_jobs`
+claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so several workers
+never run the same job, and calls the handler registered under the job's
+name. A failed job is retried with exponential backoff until it has been
+tried JOB_MAX_ATTEMPTS times. A job left running by a worker which died is
+picked up again after JOB_TIMEOUT seconds, or failed when it has no
+attempts left. Finished jobs are deleted after JOB_RETENTION seconds.
+Payloads are readable in the database, keep secrets such as tokens out of
+them and build those in the handler.
+"""
+import datetime
+import logging
+import traceback
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template import loader
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from main.choices import JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING
+from main.models import Job, User
+
+logger = logging.getLogger(__name__)
+
+SEND_EMAIL = "send_email"
+SEND_PASSWORD_RESET = "send_password_reset"
+
+# the password reset context which is safe to store, see enqueue_password_reset
+PASSWORD_RESET_CONTEXT = ("domain", "site_name", "protocol")
+
+# name: handler(payload)
+JOB_HANDLERS = {}
+
+
+def register(name):
+    def decorator(handler):
+        JOB_HANDLERS[name] = handler
+        return handler
+
+    return decorator
+
+
+def enqueue(name, payload, run_at=None):
+    if name not in JOB_HANDLERS:
+        raise ValueError(f"No handler registered for job '{name}'")
+    return Job.objects.create(
+        name=name, payload=payload, run_at=run_at or timezone.now()
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts"""
+    return min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_MAX_BACKOFF
+    )
+
+
+def claim_jobs(limit):
+    """Mark up to limit due jobs as running and return them"""
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.JOB_TIMEOUT)
+
+    with transaction.atomic():
+        # a job which keeps killing its worker must not be retried forever
+        abandoned = Job.objects.filter(
+            status=JOB_RUNNING,
+            locked_at__lt=stale,
+            attempts__gte=settings.JOB_MAX_ATTEMPTS,
+        ).update(
+            status=JOB_FAILED,
+            locked_at=None,
+            last_error="The worker did not finish the job within JOB_TIMEOUT",
+            updated_at=now,
+        )
+        if abandoned:
+            logger.error("%s jobs failed for good, their workers stopped", abandoned)
+
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=JOB_PENDING, run_at__lte=now)
+                | Q(status=JOB_RUNNING, locked_at__lt=stale)
+            )
+            .order_by("run_at", "id")[:limit]
+        )
+        for job in jobs:
+            job.status = JOB_RUNNING
+            job.locked_at = now
+            job.attempts += 1
+            job.updated_at = now
+        Job.objects.bulk_update(jobs, ["status", "locked_at", "attempts", "updated_at"])
+    return jobs
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome, True when it succeeded"""
+    try:
+        JOB_HANDLERS[job.name](job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+            job.status = JOB_FAILED
+            logger.error("Job %s failed for good:\n%s", job, job.last_error)
+        else:
+            job.status = JOB_PENDING
+            job.run_at = timezone.now() + datetime.timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+            logger.warning("Job %s failed, retrying at %s", job, job.run_at)
+        succeeded = False
+    else:
+        job.status = JOB_DONE
+        job.last_error = ""
+        succeeded = True
+
+    job.locked_at = None
+    job.updated_at = timezone.now()
+    job.save(
+        update_fields=["status", "run_at", "locked_at", "last_error", "updated_at"]
+    )
+    return succeeded
+
+
+def run_jobs(limit):
+    """Claim and run one batch of jobs, returns how many were claimed"""
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def purge_jobs():
+    """Delete jobs which finished over JOB_RETENTION seconds ago"""
+    finished_before = timezone.now() - datetime.timedelta(
+        seconds=settings.JOB_RETENTION
+    )
+    deleted, _ = Job.objects.filter(
+        status__in=[JOB_DONE, JOB_FAILED], updated_at__lt=finished_before
+    ).delete()
+    return deleted
+
+
+# EMAIL
+
+_mail_connection = None
+
+
+def get_mail_connection():
+    """
+    One connection shared by the queued messages
+    so the SMTP handshake is not repeated for every message
+    """
+    global _mail_connection
+    if _mail_connection is None:
+        _mail_connection = get_connection()
+        _mail_connection.open()
+    return _mail_connection
+
+
+def close_mail_connection():
+    global _mail_connection
+    if _mail_connection is not None:
+        connection, _mail_connection = _mail_connection, None
+        try:
+            connection.close()
+        except Exception:
+            logger.exception("Could not close the mail connection")
+
+
+def enqueue_email(message):
+    """Send an EmailMultiAlternatives (or EmailMessage) from the job queue"""
+    return enqueue(
+        SEND_EMAIL,
+        {
+            "subject": message.subject,
+            "body": message.body,
+            "from_email": message.from_email,
+            "to": message.to,
+            "cc": message.cc,
+            "bcc": message.bcc,
+            "reply_to": message.reply_to,
+            "alternatives": getattr(message, "alternatives", []),
+        },
+    )
+
+
+def enqueue_password_reset(
+    user,
+    context,
+    subject_template_name,
+    email_template_name,
+    from_email,
+    html_email_template_name=None,
+):
+    """
+    Send a password reset email from the job queue
+    Only the user's id is stored, the link and its token are made when the
+    job runs
+    """
+    return enqueue(
+        SEND_PASSWORD_RESET,
+        {
+            "user_id": user.pk,
+            "context": {name: context[name] for name in PASSWORD_RESET_CONTEXT},
+            "subject_template_name": subject_template_name,
+            "email_template_name": email_template_name,
+            "html_email_template_name": html_email_template_name,
+            "from_email": from_email,
+        },
+    )
+
+
+def send_message(message):
+    message.connection = get_mail_connection()
+    try:
+        message.send()
+    except Exception:
+        # the server may have dropped the connection, open a new one
+        # for the next message
+        close_mail_connection()
+        raise
+
+
+@register(SEND_EMAIL)
+def send_email(payload):
+    payload = dict(payload)
+    alternatives = [tuple(item) for item in payload.pop("alternatives")]
+    send_message(EmailMultiAlternatives(**payload, alternatives=alternatives))
+
+
+@register(SEND_PASSWORD_RESET)
+def send_password_reset(payload):
+    user = User.objects.filter(pk=payload["user_id"], is_active=True).first()
+    if user is None:
+        logger.info("Not sending a password reset, user %s is gone", payload["user_id"])
+        return
+
+    context = {
+        **payload["context"],
+        "email": user.email,
+        "user": user,
+        "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+        "token": default_token_generator.make_token(user),
+    }
+    subject = loader.render_to_string(payload["subject_template_name"], context)
+    # Email subject *must not* contain newlines
+    subject = "".join(subject.splitlines())
+    body = loader.render_to_string(payload["email_template_name"], context)
+
+    message = EmailMultiAlternatives(subject, body, payload["from_email"], [user.email])
+    if payload["html_email_template_name"] is not None:
+        html_email = loader.render_to_string(
+            payload["html_email_template_name"], context
+        )
+        message.attach_alternative(html_email, "text/html")
+    send_message(message)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from main.schema import code_version
+from main.urls import schema_view
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the OpenAPI documents for the current code version "
+        "so they are not built on the first request"
+    )
+
+    def handle(self, *args, **options):
+        for path in schema_view.generate():
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(self.style.SUCCESS(f"Schema version {code_version()}"))
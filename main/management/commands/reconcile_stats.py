@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from main.counters import find_drift, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stats counters from the source tables and report any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drift, leave the counters untouched",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            drift = find_drift()
+        else:
+            drift = rebuild_counters()
+
+        for (name, user_id, day), (stored, counted) in sorted(
+            drift.items(), key=lambda item: str(item[0])
+        ):
+            self.stdout.write(
+                f"{name} user={user_id or '-'} day={day or '-'}: "
+                f"stored {stored}, counted {counted}"
+            )
+
+        if drift:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} counters drifted"))
+        else:
+            self.stdout.write("No drift found")
+
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("Counters rebuilt"))
@@ -0,0 +1,64 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main.jobs import close_mail_connection, purge_jobs, run_jobs
+
+# seconds between deleting old finished jobs
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs, e.g password reset emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Jobs claimed at a time",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before looking again when no job is due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no job is due instead of waiting for more",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        processed = purged = 0
+        next_purge = 0
+        while not self.stopping:
+            close_old_connections()
+            if time.monotonic() >= next_purge:
+                purged += purge_jobs()
+                next_purge = time.monotonic() + PURGE_INTERVAL
+
+            claimed = run_jobs(options["batch_size"])
+            processed += claimed
+            if claimed:
+                continue
+
+            # keep the mail connection while busy, servers drop idle ones
+            close_mail_connection()
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+        close_mail_connection()
+        self.stdout.write(f"{processed} jobs run, {purged} old jobs deleted")
+
+    def stop(self, signum, frame):
+        # finish the current batch, then exit
+        self.stopping = True
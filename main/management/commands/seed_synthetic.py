@@ -0,0 +1,61 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import User
+from main.synthetic import SyntheticData
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, wards, patients, referrals, "
+        "admissions and prescriptions for load and scale testing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="The same seed, sizes and end date give the same rows",
+        )
+        parser.add_argument(
+            "--patients",
+            type=int,
+            default=100000,
+            help="Patients to register, the other records scale with them",
+        )
+        parser.add_argument("--staff", type=int, default=200, help="Users to create")
+        parser.add_argument("--wards", type=int, default=10, help="Wards to create")
+        parser.add_argument(
+            "--days", type=int, default=365, help="Days the records are spread over"
+        )
+        parser.add_argument(
+            "--end",
+            type=datetime.date.fromisoformat,
+            default=None,
+            help="Last day of the period, YYYY-MM-DD (default today)",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("patients", "staff", "wards", "days"):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1")
+
+        data = SyntheticData(
+            seed=options["seed"],
+            patients=options["patients"],
+            staff=options["staff"],
+            wards=options["wards"],
+            days=options["days"],
+            end=options["end"],
+        )
+        if User.objects.filter(username__startswith=f"synthetic{data.seed}-").exists():
+            raise CommandError(
+                f"The database was already seeded with seed {data.seed}, "
+                "use another --seed or flush it first"
+            )
+
+        counts = data.generate(log=self.stdout.write)
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(f"Created {total} rows"))
@@ -0,0 +1,157 @@
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from rest_framework.permissions import SAFE_METHODS
+
+from liveup.db.routers import pin_to_primary
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only API payloads are compressed, HTML pages carry CSRF tokens which
+# compression would expose to BREACH
+COMPRESSIBLE_CONTENT_TYPE_RE = _lazy_re_compile(
+    r"^(application/(json|x-ndjson|yaml|xml|javascript)|application/[\w.-]+\+json"
+    r"|text/(csv|plain|javascript|css))\b"
+)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress API responses with brotli or gzip, whichever the client accepts
+    first in COMPRESSION_ENCODINGS, once they reach COMPRESSION_MIN_SIZE
+    bytes. Streaming responses are compressed chunk by chunk and always
+    compressed since their size is not known upfront.
+
+    Static files are served precompressed by WhiteNoise and never reach
+    this middleware.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+        self.encodings = [
+            encoding
+            for encoding in settings.COMPRESSION_ENCODINGS
+            if encoding == "gzip" or (encoding == "br" and brotli is not None)
+        ]
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+        if not COMPRESSIBLE_CONTENT_TYPE_RE.match(response.get("Content-Type", "")):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = self.select_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.compress_sequence(
+                encoding, response.streaming_content
+            )
+            del response["Content-Length"]
+        else:
+            encoder = self.get_encoder(encoding)
+            compressed = encoder.compress(response.content) + encoder.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # the body differs byte for byte from the uncompressed one
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    def select_encoding(self, accept_encoding):
+        accepted = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+
+        for encoding in self.encodings:
+            if accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return None
+
+    def get_encoder(self, encoding):
+        if encoding == "br":
+            return BrotliEncoder(settings.COMPRESSION_BROTLI_QUALITY)
+        return GzipEncoder(settings.COMPRESSION_GZIP_LEVEL)
+
+    def compress_sequence(self, encoding, sequence):
+        encoder = self.get_encoder(encoding)
+        for item in sequence:
+            data = encoder.compress(item) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """
+    Keep a user who changed something reading from the primary for
+    REPLICA_PIN_SECONDS, until the replicas have caught up with the write
+    """
+
+    def process_response(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return response
+
+        # set by DRF's authentication, which runs inside the view
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
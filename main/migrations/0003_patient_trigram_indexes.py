@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# Trigram indexes behind patient search. They index UPPER(column) because
+# that is what icontains compares, so both substring and similarity
+# matches can use them. pg_trgm ships with the contrib package which some
+# PostgreSQL installs leave out, so the extension and its indexes are only
+# created when available; search falls back to plain substring matching.
+# The indexes are built concurrently so patients can still be written
+# meanwhile, which rules out a DO block and a transaction.
+TRIGRAM_INDEXES = {
+    'patient_name_trgm': 'patient_name',
+    'patient_number_trgm': 'patient_number',
+    'patient_contacts_trgm': 'contacts',
+}
+
+# a build which failed or was cancelled leaves an invalid index behind,
+# which IF NOT EXISTS would keep
+FIND_INVALID_INDEX = """
+SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid;
+"""
+
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm';")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+
+        for name, column in TRIGRAM_INDEXES.items():
+            cursor.execute(FIND_INVALID_INDEX, [name])
+            if cursor.fetchone() is not None:
+                cursor.execute(f'DROP INDEX CONCURRENTLY {name};')
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                f'ON main_patient USING gin ((UPPER({column}::text)) gin_trgm_ops);'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for name in TRIGRAM_INDEXES:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name};')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0002_statcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-17 23:11
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0003_patient_trigram_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='admission',
+            index=models.Index(fields=['-created_at', '-id'], name='admission_created_at_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['-created_at', '-id'], name='patient_created_at_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='prescription',
+            index=models.Index(fields=['-created_at', '-id'], name='prescription_created_at_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=models.Index(fields=['-created_at', '-id'], name='referral_created_at_id_idx'),
+        ),
+    ]
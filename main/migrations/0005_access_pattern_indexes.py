@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-17 23:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('main', '0004_created_at_id_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='admission',
+            index=models.Index(fields=['created_by', '-created_at'], include=('id',), name='admission_created_by_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='admission',
+            index=models.Index(fields=['patient', '-created_at'], name='admission_patient_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['created_by', '-created_at'], include=('id',), name='patient_created_by_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='prescription',
+            index=models.Index(fields=['created_by', '-created_at'], include=('id',), name='prescription_created_by_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='prescription',
+            index=models.Index(fields=['patient', '-created_at'], name='prescription_patient_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=models.Index(fields=['created_by', '-created_at'], include=('id',), name='referral_created_by_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=models.Index(fields=['doctor', '-created_at'], include=('id',), name='referral_doctor_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='referral',
+            index=models.Index(fields=['patient', '-created_at'], name='referral_patient_idx'),
+        ),
+    ]
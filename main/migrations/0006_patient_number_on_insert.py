@@ -0,0 +1,103 @@
+from django.db import IntegrityError, migrations
+
+import main.models
+
+# Patient numbers used to be written by a second UPDATE after every
+# INSERT. A BEFORE INSERT trigger now derives them from the id the
+# sequence assigns, within the same INSERT.
+FILL_PATIENT_NUMBERS = """
+UPDATE main_patient SET patient_number = 'P-' || id
+WHERE patient_number IS NULL OR patient_number = '';
+"""
+
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION main_patient_assign_number() RETURNS trigger AS $$
+BEGIN
+    IF NEW.patient_number IS NULL OR NEW.patient_number = '' THEN
+        NEW.patient_number := 'P-' || NEW.id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- the migration is not atomic, a failed run may have created it
+DROP TRIGGER IF EXISTS main_patient_assign_number ON main_patient;
+CREATE TRIGGER main_patient_assign_number
+    BEFORE INSERT ON main_patient
+    FOR EACH ROW EXECUTE PROCEDURE main_patient_assign_number();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS main_patient_assign_number ON main_patient;
+DROP FUNCTION IF EXISTS main_patient_assign_number();
+"""
+
+FIND_DUPLICATE_NUMBERS = """
+SELECT patient_number, COUNT(*) FROM main_patient
+GROUP BY patient_number HAVING COUNT(*) > 1
+ORDER BY patient_number LIMIT 10;
+"""
+
+FIND_INVALID_INDEX = """
+SELECT 1 FROM pg_index
+WHERE indexrelid = to_regclass('main_patient_patient_number_uniq') AND NOT indisvalid;
+"""
+
+
+def prepare_unique_index(apps, schema_editor):
+    """
+    Duplicate numbers, e.g edited in the admin, would fail the concurrent
+    build and leave an invalid index behind which IF NOT EXISTS then keeps
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(FIND_DUPLICATE_NUMBERS)
+        duplicates = cursor.fetchall()
+        if duplicates:
+            listed = ', '.join(f'{number} ({count})' for number, count in duplicates)
+            raise IntegrityError(
+                f'Patients share these patient numbers: {listed}. Give each '
+                f'patient a number of its own, then migrate again.'
+            )
+
+        cursor.execute(FIND_INVALID_INDEX)
+        if cursor.fetchone() is not None:
+            cursor.execute('DROP INDEX CONCURRENTLY main_patient_patient_number_uniq;')
+
+
+class Migration(migrations.Migration):
+
+    # the unique index is built concurrently
+    atomic = False
+
+    dependencies = [
+        ('main', '0005_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FILL_PATIENT_NUMBERS, migrations.RunSQL.noop),
+        migrations.RunPython(prepare_unique_index, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'ALTER TABLE main_patient ALTER COLUMN patient_number TYPE varchar(20);',
+                    'ALTER TABLE main_patient ALTER COLUMN patient_number TYPE varchar(10);',
+                ),
+                migrations.RunSQL(
+                    'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS main_patient_patient_number_uniq ON main_patient (patient_number);',
+                    'DROP INDEX CONCURRENTLY IF EXISTS main_patient_patient_number_uniq;',
+                ),
+                migrations.RunSQL(
+                    'ALTER TABLE main_patient ADD CONSTRAINT main_patient_patient_number_uniq UNIQUE USING INDEX main_patient_patient_number_uniq;',
+                    'ALTER TABLE main_patient DROP CONSTRAINT IF EXISTS main_patient_patient_number_uniq;',
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='patient',
+                    name='patient_number',
+                    field=main.models.PatientNumberField(blank=True, max_length=20, unique=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,361 @@
+import asyncio
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Max
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.urls import NoReverseMatch
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.serializers import BaseSerializer, PrimaryKeyRelatedField
+from rest_framework.utils.field_mapping import get_detail_view_name
+
+from liveup.db.routers import choose_replica, is_pinned, use_replica
+from main.reference import get_list, get_version
+from main.serializers import is_compact
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve with 304 Not Modified while the client's
+    ETag (or Last-Modified for a single object) is still current
+
+    A list is validated with the row count and the latest created_at or
+    updated_at of the filtered queryset, one aggregate query, so nothing is
+    fetched or serialized when the client already has the page. Keyset
+    pages skip the COUNT and are validated with the id and timestamps of
+    the rows on the page instead. Relations expanded with ?expand= are
+    validated with their updated_at too; when one of them has no
+    updated_at, e.g a user, the response is sent without validators.
+    Writes made outside the API must set updated_at for the validators to
+    change.
+    """
+
+    def list(self, request, *args, **kwargs):
+        related = self.get_validated_relations()
+        if related is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = self.get_etag(*self.get_list_validators(queryset, related))
+
+        return self.conditional_response(
+            etag, None, lambda: super(ConditionalGetMixin, self).list(request)
+        )
+
+    def get_validated_relations(self):
+        """
+        Lookups of the relations the serializer renders nested, or None when
+        one of them cannot be validated
+        """
+        serializer = self.get_serializer()
+        lookups = serializer_columns(serializer)
+        if lookups is None:
+            nested = any(
+                isinstance(field, BaseSerializer)
+                for field in serializer.fields.values()
+            )
+            return None if nested else []
+
+        related = lookups[1]
+        for lookup in related:
+            model = serializer.Meta.model
+            for name in lookup.split("__"):
+                model = model._meta.get_field(name).related_model
+            try:
+                model._meta.get_field("updated_at")
+            except FieldDoesNotExist:
+                return None
+        return related
+
+    def get_list_validators(self, queryset, related=()):
+        get_keyset_window = getattr(self.paginator, "get_keyset_window", None)
+        window = (
+            get_keyset_window(queryset, self.request) if get_keyset_window else None
+        )
+        if window is not None:
+            return list(
+                window.values_list(
+                    "pk",
+                    "created_at",
+                    "updated_at",
+                    *(f"{lookup}__updated_at" for lookup in related),
+                )
+            )
+
+        validators = queryset.order_by().aggregate(
+            count=Count("pk"),
+            modified=Max(Coalesce("updated_at", "created_at")),
+            **{
+                f"related_{index}": Max(f"{lookup}__updated_at")
+                for index, lookup in enumerate(related)
+            },
+        )
+        return list(validators.values())
+
+    def retrieve(self, request, *args, **kwargs):
+        related = self.get_validated_relations()
+        if related is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        instance = self.get_object()
+        modified = [instance.updated_at or instance.created_at]
+        for lookup in related:
+            obj = instance
+            for name in lookup.split("__"):
+                obj = getattr(obj, name) if obj is not None else None
+            modified.append(obj.updated_at if obj is not None else None)
+        etag = self.get_etag(instance.pk, *modified)
+
+        last_modified = max(filter(None, modified), default=None)
+        return self.conditional_response(
+            etag,
+            int(last_modified.timestamp()) if last_modified else None,
+            lambda: Response(self.get_serializer(instance).data),
+        )
+
+    def get_etag(self, *validators):
+        # the same rows are rendered differently per page, format and user
+        request = self.request
+        key = "|".join(
+            str(value)
+            for value in (
+                request.get_full_path(),
+                request.accepted_media_type,
+                request.user.pk,
+                *validators,
+            )
+        )
+        return quote_etag(hashlib.md5(key.encode("utf-8")).hexdigest())
+
+    def conditional_response(self, etag, last_modified, get_response):
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = get_response()
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        # cached copies must be revalidated and are per user
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def serializer_columns(serializer, prefix=""):
+    """
+    The (only, select_related) lookups needed to render serializer, or
+    None when a field is not backed by a model field
+    """
+    model = serializer.Meta.model
+    columns, related = [], []
+
+    for field in serializer.fields.values():
+        if field.source == "*":
+            # the hyperlink to the row itself only needs the primary key
+            continue
+
+        try:
+            model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+
+        columns.append(prefix + field.source)
+        if isinstance(field, BaseSerializer):
+            nested = serializer_columns(field, f"{prefix}{field.source}__")
+            if nested is None:
+                return None
+            related.append(prefix + field.source)
+            columns += nested[0]
+            related += nested[1]
+
+    return columns, related
+
+
+class SparseFieldsMixin:
+    """
+    Only select the columns and join the relations the serializer renders,
+    so ?fields= and ?expand= narrow the SQL as well as the response
+    """
+
+    # loaded whatever the serializer renders, e.g for pagination and ETags
+    always_loaded_fields = ("created_at", "updated_at")
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        lookups = serializer_columns(self.get_serializer())
+        if lookups is None:
+            return queryset
+
+        columns, related = lookups
+        model_fields = {field.name for field in queryset.model._meta.get_fields()}
+        columns += [name for name in self.always_loaded_fields if name in model_fields]
+        return queryset.select_related(None).select_related(*related).only(*columns)
+
+
+class CompactMixin:
+    """
+    Paginated responses in compact mode, where serializers render ids
+    instead of hyperlinks, carry url_templates to build the links back, e.g
+    {"url": ".../patients/{id}/", "created_by": ".../users/{id}/"}
+    """
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if is_compact(self.request):
+            response.data["url_templates"] = self.get_url_templates()
+        return response
+
+    def get_url_templates(self):
+        serializer = self.get_serializer()
+        model = serializer.Meta.model
+
+        models = {"url": model} if "id" in serializer.fields else {}
+        for name, field in serializer.fields.items():
+            if isinstance(field, PrimaryKeyRelatedField):
+                models[name] = model._meta.get_field(field.source).related_model
+
+        templates = {}
+        for name, related_model in models.items():
+            try:
+                url = reverse(
+                    get_detail_view_name(related_model),
+                    kwargs={"pk": "__id__"},
+                    request=self.request,
+                )
+            except NoReverseMatch:
+                continue
+            templates[name] = url.replace("__id__", "{id}")
+        return templates
+
+
+class AsyncViewMixin:
+    """
+    Lets an APIView define async handlers, e.g async def get(...)
+    Authentication, permissions and throttling run through sync_to_async
+    since they may query the database. Under ASGI the view no longer holds
+    a thread while it waits, see liveup/asgi.py.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        # Django only awaits views which are coroutine functions
+        @functools.wraps(view)
+        async def async_view(*args, **kwargs):
+            return await view(*args, **kwargs)
+
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        # mirrors APIView.dispatch
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class ReplicaReadMixin:
+    """
+    Read from a replica during safe requests, see liveup.db.routers
+
+    For views where data a few seconds old is fine. Users who just wrote
+    keep reading from the primary, so they see their own changes.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request.user.pk):
+            use_replica(choose_replica())
+
+    def dispatch(self, request, *args, **kwargs):
+        # Reset whichever way the view ends, the context outlives the
+        # request when the view raises. Not a token reset, under ASGI
+        # initial() runs in another context.
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            use_replica(None)
+            raise
+        if asyncio.iscoroutine(response):
+            return self.dispatch_async(response)
+        use_replica(None)
+        return response
+
+    async def dispatch_async(self, response):
+        try:
+            return await response
+        finally:
+            use_replica(None)
+
+
+class ReferenceListMixin(ConditionalGetMixin):
+    """
+    Serve the list of a reference viewset from main.reference's cache
+
+    The list is validated with the cached version, so a client holding the
+    current ETag gets a 304 without any query. Without REFERENCE_CACHE the
+    list is built on every request.
+    """
+
+    # the main.reference list the view serves
+    reference_list = None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.REFERENCE_CACHE:
+            return super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+
+        version = get_version(self.reference_list)
+        etag = self.get_etag(version)
+
+        return self.conditional_response(
+            etag, None, lambda: Response(self.get_reference_data(version))
+        )
+
+    def get_reference_data(self, version):
+        request = self.request
+        # hyperlinks carry the host, ?fields= and ?compact= change the rows
+        variant = hashlib.md5(
+            f"{request.build_absolute_uri()}|{request.accepted_media_type}".encode()
+        ).hexdigest()
+        return get_list(
+            self.reference_list, version, variant, self.build_reference_data
+        )
+
+    def build_reference_data(self):
+        # the list is kept until the next write, a lagging replica would
+        # leave it out of date for that long
+        use_replica(None)
+        return list(super(ConditionalGetMixin, self).list(self.request).data)
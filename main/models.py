@@ -8,9 +8,16 @@ from django.core.validators import (
 )
 from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
-from django.db.models.signals import post_save
 
-from main.choices import NOT_SEEN, RECEPTIONIST, REFERAL_STATUS, ROLES
+from main.choices import (
+    JOB_PENDING,
+    JOB_RUNNING,
+    JOB_STATUS,
+    NOT_SEEN,
+    RECEPTIONIST,
+    REFERAL_STATUS,
+    ROLES,
+)
 
 
 class User(AbstractUser):
@@ -27,8 +34,18 @@ class User(AbstractUser):
         return self.username
 
 
+class PatientNumberField(models.CharField):
+    """
+    Filled in by a database trigger on insert (see migration 0006)
+    db_returning makes Django read it back from INSERT ... RETURNING,
+    for bulk_create too, so no follow-up UPDATE or SELECT is needed
+    """
+
+    db_returning = True
+
+
 class Patient(models.Model):
-    patient_number = models.CharField(max_length=10, blank=True)
+    patient_number = PatientNumberField(max_length=20, blank=True, unique=True)
     next_of_kin = models.CharField(max_length=50)
     address = models.CharField(max_length=50)
     date_of_birth = models.DateField(
@@ -52,6 +69,16 @@ class Patient(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="patient_created_at_id_idx"
+            ),
+            models.Index(
+                fields=["created_by", "-created_at"],
+                include=["id"],
+                name="patient_created_by_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.patient_name
@@ -63,23 +90,11 @@ class Patient(models.Model):
             today.year - born.year - ((today.month, today.day) < (born.month, born.day))
         )
 
-    def generate_patient_number(self):
-        self.patient_number = f"P-{self.pk}"
-
     def save(self, *args, **kwargs):
         self.calculate_age()
         super().save(*args, **kwargs)
 
 
-def patient_post_save(sender, instance, created, *args, **kwargs):
-    if created:
-        instance.generate_patient_number()
-        instance.save()
-
-
-post_save.connect(patient_post_save, sender=Patient)
-
-
 class Prescription(models.Model):
     patient = models.ForeignKey(
         Patient, on_delete=models.CASCADE, related_name="patient_prescribed"
@@ -107,6 +122,19 @@ class Prescription(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="prescription_created_at_id_idx"
+            ),
+            models.Index(
+                fields=["created_by", "-created_at"],
+                include=["id"],
+                name="prescription_created_by_idx",
+            ),
+            models.Index(
+                fields=["patient", "-created_at"], name="prescription_patient_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Prescribed by {self.created_by} for {self.patient}"
@@ -159,6 +187,19 @@ class Admission(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="admission_created_at_id_idx"
+            ),
+            models.Index(
+                fields=["created_by", "-created_at"],
+                include=["id"],
+                name="admission_created_by_idx",
+            ),
+            models.Index(
+                fields=["patient", "-created_at"], name="admission_patient_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.patient} admitted to {self.ward}"
@@ -187,6 +228,98 @@ class Referral(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="referral_created_at_id_idx"
+            ),
+            models.Index(
+                fields=["created_by", "-created_at"],
+                include=["id"],
+                name="referral_created_by_idx",
+            ),
+            models.Index(
+                fields=["doctor", "-created_at"],
+                include=["id"],
+                name="referral_doctor_idx",
+            ),
+            models.Index(
+                fields=["patient", "-created_at"], name="referral_patient_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.patient} referred to {self.doctor}"
+
+
+class StatCounter(models.Model):
+    """
+    Running count behind the stats endpoints, kept up to date by main.counters
+    A counter is global (no user, no day), per user (no day)
+    or per user per day
+    """
+
+    name = models.CharField(max_length=50)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="stat_counters",
+    )
+    day = models.DateField(null=True, blank=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name"],
+                condition=models.Q(user__isnull=True, day__isnull=True),
+                name="unique_global_stat_counter",
+            ),
+            models.UniqueConstraint(
+                fields=["name", "user"],
+                condition=models.Q(day__isnull=True),
+                name="unique_user_stat_counter",
+            ),
+            models.UniqueConstraint(
+                fields=["name", "user", "day"], name="unique_daily_stat_counter"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.user_id}, {self.day}): {self.value}"
+
+
+class Job(models.Model):
+    """
+    Work done outside the request by `manage.py run_jobs`, see main.jobs
+    """
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=JOB_STATUS, default=JOB_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["run_at", "id"]
+        indexes = [
+            # workers only look for jobs which still have to run
+            models.Index(
+                fields=["run_at", "id"],
+                name="job_pending_idx",
+                condition=models.Q(status=JOB_PENDING),
+            ),
+            models.Index(
+                fields=["locked_at"],
+                name="job_running_idx",
+                condition=models.Q(status=JOB_RUNNING),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} #{self.pk} ({self.status})"
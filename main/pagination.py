@@ -0,0 +1,221 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class PatientSearchPagination(PageNumberPagination):
+    """Small pages for front-desk lookups, clients may ask for up to 50"""
+
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 50
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over (created_at, id), newest first
+    Every page is a range scan on the (created_at, id) index so deep pages
+    cost the same as the first one. No COUNT(*) is issued.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        position = self.decode_cursor(request)
+
+        results = list(self.get_window(queryset, position))
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if position is not None and position[2]:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def get_window(self, queryset, position):
+        """The page at position, plus one row to tell whether there is more"""
+        queryset = queryset.order_by("-created_at", "-id")
+        if position is not None:
+            created_at, pk, reverse = position
+            if reverse:
+                queryset = (
+                    queryset.filter(created_at__gte=created_at)
+                    .filter(Q(created_at__gt=created_at) | Q(id__gt=pk))
+                    .order_by("created_at", "id")
+                )
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                )
+        return queryset[: self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(last.created_at, last.pk, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        first = self.page[0]
+        return self.encode_cursor(first.created_at, first.pk, reverse=True)
+
+    def decode_cursor(self, request):
+        tokens = self.decode_tokens(request)
+        if tokens is None:
+            return None
+
+        try:
+            created_at = parse_datetime(tokens["p"][0])
+            pk = int(tokens["i"][0])
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk, reverse
+
+    def encode_cursor(self, created_at, pk, reverse):
+        tokens = {"p": created_at.isoformat(), "i": pk}
+        if reverse:
+            tokens["r"] = "1"
+        return self.encode_tokens(tokens)
+
+    def decode_tokens(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            return parse.parse_qs(querystring, keep_blank_values=True)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_tokens(self, tokens):
+        encoded = b64encode(parse.urlencode(tokens).encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination unless the client opts into keyset pagination
+    with ?pagination=cursor, after which the next and previous links carry
+    a cursor. Meant for viewsets over models ordered by -created_at.
+    """
+
+    mode_query_param = "pagination"
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def get_keyset_window(self, queryset, request):
+        """The rows a keyset page is built from, None for page numbers"""
+        if not self.use_keyset(request):
+            return None
+        keyset = self.keyset_class()
+        return keyset.get_window(queryset, keyset.decode_cursor(request))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            self.display_page_controls = False
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Forward only cursor over a patient's timeline, newest first
+    Entries are ordered by (created_at, kind, id), see main.timeline
+    """
+
+    def paginate_timeline(self, fetch, request):
+        """fetch(position, limit) returns the entries after position"""
+        self.base_url = request.build_absolute_uri()
+        entries = fetch(self.decode_cursor(request), self.page_size + 1)
+
+        self.has_next = len(entries) > self.page_size
+        self.page = entries[: self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.encode_tokens(
+            {"p": last.created_at.isoformat(), "k": last.kind, "i": last.pk}
+        )
+
+    def get_previous_link(self):
+        return None
+
+    def decode_cursor(self, request):
+        tokens = self.decode_tokens(request)
+        if tokens is None:
+            return None
+
+        try:
+            created_at = parse_datetime(tokens["p"][0])
+            kind = tokens["k"][0]
+            pk = int(tokens["i"][0])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, kind, pk
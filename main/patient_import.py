@@ -0,0 +1,147 @@
+"""
+Bulk patient registration from a CSV or NDJSON upload
+
+Uploads are read line by line straight from the uploaded file, which
+Django spools to disk past FILE_UPLOAD_MAX_MEMORY_SIZE, and handled in
+chunks: every chunk is validated with the PatientSerializer rules and
+inserted with a single bulk_create, so memory use depends on the chunk
+size rather than the file size. A file which cannot be read to the end,
+e.g one not encoded as UTF-8, stops the import; the chunks before it are
+kept and the report says how far it got.
+"""
+import csv
+import io
+import json
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from main.counters import track_created
+from main.models import Patient
+from main.serializers import PatientSerializer
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+FORMATS_BY_EXTENSION = {
+    ".csv": CSV,
+    ".ndjson": NDJSON,
+    ".jsonl": NDJSON,
+}
+
+CHUNK_SIZE = 500
+
+# Past this many invalid rows only the number of failures is reported
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def detect_format(upload, requested=None):
+    if requested:
+        if requested not in (CSV, NDJSON):
+            raise ImportFormatError(f"Unsupported format '{requested}'.")
+        return requested
+
+    for extension, file_format in FORMATS_BY_EXTENSION.items():
+        if upload.name.lower().endswith(extension):
+            return file_format
+
+    raise ImportFormatError("Upload a .csv, .ndjson or .jsonl file.")
+
+
+def read_rows(upload, file_format):
+    """
+    Yield (row number, row or None when the line cannot be parsed), raises
+    ImportFormatError when the rest of the file cannot be read
+    """
+    number = 0
+    try:
+        for number, row in _parse_rows(upload, file_format):
+            yield number, row
+    except UnicodeDecodeError:
+        raise ImportFormatError(
+            f"The file is not UTF-8 encoded, stopped after row {number}."
+        )
+    except csv.Error as exc:
+        raise ImportFormatError(f"Invalid CSV after row {number}: {exc}.")
+
+
+def _parse_rows(upload, file_format):
+    lines = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+
+    if file_format == CSV:
+        # strict, an unclosed quote would otherwise swallow the rows after it
+        rows = csv.DictReader(lines, strict=True)
+        for number, row in enumerate(rows, start=1):
+            yield number, row
+        return
+
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+def import_patients(upload, file_format, user):
+    """
+    The import report, with a "file" error when the file could not be read
+    to the end
+    """
+    report = {"created": 0, "failed": 0, "errors": []}
+    chunk = []
+
+    try:
+        for row in read_rows(upload, file_format):
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                _import_chunk(chunk, user, report)
+                chunk = []
+    except ImportFormatError as exc:
+        report["file"] = [str(exc)]
+
+    if chunk:
+        _import_chunk(chunk, user, report)
+    return report
+
+
+def _import_chunk(chunk, user, report):
+    # one serializer validates the whole chunk so its fields are built once
+    serializer = PatientSerializer()
+    patients = []
+
+    for number, row in chunk:
+        if row is None:
+            _report_error(report, number, {"non_field_errors": ["Invalid JSON."]})
+            continue
+
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as exc:
+            _report_error(report, number, exc.detail)
+            continue
+
+        patient = Patient(**data, created_by=user)
+        patient.calculate_age()
+        patients.append(patient)
+
+    with transaction.atomic():
+        # patient numbers come back from the INSERT, see PatientNumberField
+        Patient.objects.bulk_create(patients)
+        track_created(patients)
+
+    report["created"] += len(patients)
+
+
+def _report_error(report, number, errors):
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": number, "errors": errors})
@@ -0,0 +1,93 @@
+"""
+Cached reference lists, e.g the wards and clinicians forms choose from
+
+A list is cached under a version kept in the shared cache. Saving or
+deleting a row the list is built from replaces the version, so every
+worker rebuilds the list on its next request instead of serving the old
+one. Each process also keeps the lists it served in memory, which leaves
+one cache lookup, for the version, per request. Writes which do not send
+signals, e.g queryset.update(), must call bump_version() themselves.
+
+The version is only seen by every worker when the cache is shared, e.g
+redis, so the lists are served uncached unless REFERENCE_CACHE is set,
+which it is by default when CACHE_URL is.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from main.models import User, Ward
+
+WARDS = "wards"
+CLINICIANS = "clinicians"
+
+# the lists each model is part of
+REFERENCE_LISTS = {
+    Ward: (WARDS,),
+    User: (CLINICIANS,),
+}
+
+# user fields which are saved on their own and not listed, e.g on login
+UNLISTED_USER_FIELDS = {"last_login", "password"}
+
+# most lists served by a process, they are few, one per query string
+LOCAL_MAX_ENTRIES = 256
+
+# {cache key: data}
+_local = {}
+
+
+def version_key(name):
+    return f"reference:version:{name}"
+
+
+def get_version(name):
+    key = version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # random so data cached under an evicted version is never reused
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    cache.set(version_key(name), uuid.uuid4().hex, None)
+
+
+def get_list(name, version, variant, build):
+    """The data cached for name at version, calls build() on a miss"""
+    key = f"reference:{name}:{version}:{variant}"
+    data = _local.get(key)
+    if data is not None:
+        return data
+
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.REFERENCE_CACHE_TTL)
+
+    if len(_local) >= LOCAL_MAX_ENTRIES:
+        # older versions are never requested again
+        _local.clear()
+    _local[key] = data
+    return data
+
+
+def reference_changed(sender, instance, update_fields=None, **kwargs):
+    if sender is User and update_fields and update_fields <= UNLISTED_USER_FIELDS:
+        return
+
+    for name in REFERENCE_LISTS[sender]:
+        bump_version(name)
+        # again once committed, a request which read the rows before the
+        # commit may have cached them under the first new version
+        transaction.on_commit(lambda name=name: bump_version(name))
+
+
+for model in REFERENCE_LISTS:
+    post_save.connect(reference_changed, sender=model)
+    post_delete.connect(reference_changed, sender=model)
@@ -0,0 +1,124 @@
+"""
+The API's JSON renderer and the renderers for the export endpoints
+
+Besides rendering ordinary responses (e.g errors) every export renderer
+can encode an iterator of rows into chunks of bytes for a streaming
+response, see render_rows.
+"""
+import csv
+import json
+
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Rows encoded per chunk written to the client
+ROWS_PER_CHUNK = 500
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, PhoneNumber):
+            return str(obj)
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer which encodes with orjson when it is installed
+    The output is the same as the stdlib renderer's: dates, times and
+    datetimes are still formatted by JSONEncoder, as are Decimals and
+    phone numbers which orjson does not know. Indented output (e.g for the
+    browsable API) and non compact settings fall back to the stdlib.
+    """
+
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (
+            orjson is None
+            or data is None
+            or indent
+            or self.ensure_ascii
+            or not self.compact
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ret = orjson.dumps(data, default=self.encoder_class().default, option=option)
+
+        # escaped like JSONRenderer does, see its render()
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+class _Echo:
+    """File-like object which hands back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(lines, rows_per_chunk):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= rows_per_chunk:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return self._encode(data).encode("utf-8") + b"\n"
+
+    def render_rows(self, columns, rows, rows_per_chunk=ROWS_PER_CHUNK):
+        lines = (self._encode(dict(zip(columns, row))) + "\n" for row in rows)
+        return _chunked(lines, rows_per_chunk)
+
+    def _encode(self, data):
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not isinstance(data, dict):
+            data = {"detail": data}
+        return b"".join(self.render_rows(list(data), [data.values()]))
+
+    def render_rows(self, columns, rows, rows_per_chunk=ROWS_PER_CHUNK):
+        writer = csv.writer(_Echo())
+        lines = (
+            writer.writerow([self._encode(value) for value in row]) for row in rows
+        )
+        yield writer.writerow(columns).encode("utf-8")
+        yield from _chunked(lines, rows_per_chunk)
+
+    def _encode(self, value):
+        if value is None:
+            return ""
+        if isinstance(value, (str, int, float)):
+            return value
+        # dates, times and the like are written the same way as in JSON
+        return JSONEncoder().default(value)
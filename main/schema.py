@@ -0,0 +1,155 @@
+"""
+OpenAPI schema built once per code version instead of on every request
+
+Introspecting every viewset and serializer takes a noticeable amount of
+CPU, so the rendered JSON and YAML documents are kept in memory and in
+SCHEMA_CACHE_DIR under a key derived from the source code, and served
+with an ETag. `manage.py generate_schema` writes them ahead of time,
+e.g at build time. The Swagger UI and ReDoc pages are rendered from a
+schema without paths, also built once, and load the document itself
+from the JSON view. The documents leave out host and schemes so they are
+the same for every request; clients then use the host serving them.
+"""
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import drf_yasg
+import rest_framework
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# Only used to avoid reading the host from the request, it is removed again
+PLACEHOLDER_URL = "http://localhost"
+
+# {(code version, api version, renderer format): (etag, content)}
+_documents = {}
+
+# {(code version, api version): Swagger}
+_ui_schemas = {}
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Hash of the project's Python sources and the schema libraries"""
+    digest = hashlib.sha256()
+    digest.update(f"{drf_yasg.__version__} {rest_framework.VERSION}".encode())
+
+    base_dir = Path(settings.BASE_DIR)
+    for app in settings.SCHEMA_SOURCE_DIRS:
+        for path in sorted((base_dir / app).rglob("*.py")):
+            if "migrations" in path.parts:
+                continue
+            digest.update(str(path.relative_to(base_dir)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def document_path(api_version, renderer):
+    extension = renderer.format.lstrip(".")
+    name = f"schema-{code_version()}-{api_version or 'default'}.{extension}"
+    return Path(settings.SCHEMA_CACHE_DIR) / name
+
+
+def read_document(path):
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
+
+def write_document(path, content):
+    """Write content atomically, a failure only costs a rebuild later"""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(handle, "wb") as temporary_file:
+            temporary_file.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except OSError:
+        logger.warning("Could not store the schema in %s", path, exc_info=True)
+
+
+def get_cached_schema_view(info, **kwargs):
+    """get_schema_view() whose JSON and YAML documents are built once"""
+    schema_view = get_schema_view(info, **kwargs)
+
+    class CachedSchemaView(schema_view):
+        def get(self, request, version="", format=None):
+            renderer = request.accepted_renderer
+            version = request.version or version or ""
+            if not isinstance(renderer, _SpecRenderer):
+                return Response(self.get_ui_schema(version))
+
+            etag, content = self.get_document(version, renderer)
+
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = HttpResponse(
+                    content, content_type=f"{renderer.media_type}; charset=utf-8"
+                )
+                response["ETag"] = etag
+            patch_cache_control(response, public=True, no_cache=True)
+            return response
+
+        @classmethod
+        def get_document(cls, version, renderer):
+            key = (code_version(), version, renderer.format)
+            if key not in _documents:
+                path = document_path(version, renderer)
+                content = read_document(path)
+                if content is None:
+                    content = cls.build_document(version, renderer)
+                    write_document(path, content)
+                etag = quote_etag(hashlib.sha1(content).hexdigest())
+                _documents[key] = (etag, content)
+            return _documents[key]
+
+        @classmethod
+        def get_ui_schema(cls, version):
+            key = (code_version(), version)
+            if key not in _ui_schemas:
+                _ui_schemas[key] = cls.build_schema(version, patterns=[])
+            return _ui_schemas[key]
+
+        @classmethod
+        def build_schema(cls, version, **kwargs):
+            request = HttpRequest()
+            request.method = "GET"
+            request = Request(request)
+            generator = cls.generator_class(
+                info, version, url=PLACEHOLDER_URL, **kwargs
+            )
+            return generator.get_schema(request, public=True)
+
+        @classmethod
+        def build_document(cls, version, renderer):
+            schema = cls.build_schema(version)
+            schema.pop("host", None)
+            schema.pop("schemes", None)
+            return renderer.render(schema)
+
+        @classmethod
+        def generate(cls, version=""):
+            """Build and store every document, returns their paths"""
+            paths = []
+            for renderer_class in cls.renderer_classes:
+                renderer = renderer_class()
+                path = document_path(version, renderer)
+                write_document(path, cls.build_document(version, renderer))
+                paths.append(path)
+            return paths
+
+    return CachedSchemaView
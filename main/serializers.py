@@ -1,12 +1,137 @@
+from django.http.multipartparser import parse_header
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.utils.model_meta import get_field_info
 
 from main.models import Admission, Patient, Prescription, Referral, User, Ward
 
 from dj_rest_auth.serializers import UserDetailsSerializer
 from dj_rest_auth.serializers import PasswordResetSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from main.authentication import TOKEN_USER_CLAIMS
+from main.forms import QueuedPasswordResetForm
 
-class PatientSerializer(serializers.HyperlinkedModelSerializer):
+
+def parse_field_paths(value):
+    """
+    "a,b.c,b.d" -> {"a": {}, "b": {"c": {}, "d": {}}}
+    None when the query param is missing
+    """
+    if value is None:
+        return None
+
+    paths = {}
+    for path in value.split(","):
+        node = paths
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return paths
+
+
+def is_compact(request):
+    """
+    Whether the client asked for ids instead of hyperlinks, with ?compact=true
+    or a compact=true parameter on the accepted media type
+    """
+    if request.query_params.get("compact") in ("1", "true"):
+        return True
+
+    media_type = getattr(request, "accepted_media_type", None)
+    if not media_type:
+        return False
+    _, params = parse_header(media_type.encode("ascii"))
+    return params.get("compact") == b"true"
+
+
+class DynamicFieldsMixin:
+    """
+    Let clients pick fields with ?fields= and nested relations with ?expand=
+    on safe requests, e.g ?fields=url,patient_name,created_by.username
+    &expand=created_by
+
+    Meta.expandable_fields maps a relation to the name of the serializer it
+    expands to, relations listed in Meta.default_expand are expanded unless
+    ?expand= says otherwise. A relation which is not expanded is a hyperlink,
+    or its id in compact mode where url is replaced by id as well.
+    """
+
+    # set by the parent serializer on nested serializers
+    requested_fields = None
+    requested_expand = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+
+        if self.is_root():
+            requested_fields = parse_field_paths(request.query_params.get("fields"))
+            requested_expand = parse_field_paths(request.query_params.get("expand"))
+        else:
+            requested_fields = self.requested_fields
+            requested_expand = self.requested_expand
+
+        compact = is_compact(request)
+        if requested_fields:
+            for name, field in list(fields.items()):
+                # in compact mode ?fields=id keeps the url, rendered as id
+                identity = compact and isinstance(
+                    field, serializers.HyperlinkedIdentityField
+                )
+                if name not in requested_fields and not (
+                    identity and "id" in requested_fields
+                ):
+                    del fields[name]
+
+        expandable = getattr(self.Meta, "expandable_fields", {})
+        if requested_expand is None:
+            requested_expand = {
+                name: {} for name in getattr(self.Meta, "default_expand", ())
+            }
+
+        for name in expandable.keys() & fields.keys():
+            if name in requested_expand:
+                serializer = globals()[expandable[name]](read_only=True)
+                serializer.requested_fields = (requested_fields or {}).get(name)
+                serializer.requested_expand = requested_expand[name] or None
+                fields[name] = serializer
+            elif isinstance(fields[name], serializers.BaseSerializer):
+                fields[name] = self.build_collapsed_field(name)
+
+        if compact:
+            return self.compact_fields(fields)
+        return fields
+
+    def compact_fields(self, fields):
+        compact = {}
+        for name, field in fields.items():
+            if isinstance(field, serializers.HyperlinkedIdentityField):
+                if "id" not in fields:
+                    compact["id"] = serializers.ReadOnlyField()
+            elif isinstance(field, serializers.HyperlinkedRelatedField):
+                compact[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            else:
+                compact[name] = field
+        return compact
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def build_collapsed_field(self, name):
+        relation_info = get_field_info(self.Meta.model).relations[name]
+        field_class, kwargs = self.build_relational_field(name, relation_info)
+        kwargs.pop("queryset", None)
+        kwargs.pop("required", None)
+        return field_class(read_only=True, **kwargs)
+
+
+class PatientSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Patient
         fields = [
@@ -23,6 +148,10 @@ class PatientSerializer(serializers.HyperlinkedModelSerializer):
             "updated_by",
             "updated_at",
         ]
+        expandable_fields = {
+            "created_by": "UserSerializer",
+            "updated_by": "UserSerializer",
+        }
         read_only_fields = [
             "age",
             "patient_number",
@@ -33,7 +162,7 @@ class PatientSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -55,7 +184,7 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         ]
 
 
-class ReferralSerializer(serializers.HyperlinkedModelSerializer):
+class ReferralSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Referral
         fields = [
@@ -68,10 +197,18 @@ class ReferralSerializer(serializers.HyperlinkedModelSerializer):
             "updated_at",
             "updated_by",
         ]
+        expandable_fields = {
+            "patient": "PatientSerializer",
+            "doctor": "UserSerializer",
+            "created_by": "UserSerializer",
+            "updated_by": "UserSerializer",
+        }
         read_only_fields = ["created_by", "updated_at", "updated_by", "created_at"]
 
 
-class PrescriptionSerializer(serializers.HyperlinkedModelSerializer):
+class PrescriptionSerializer(
+    DynamicFieldsMixin, serializers.HyperlinkedModelSerializer
+):
     class Meta:
         model = Prescription
         fields = [
@@ -85,16 +222,21 @@ class PrescriptionSerializer(serializers.HyperlinkedModelSerializer):
             "updated_at",
             "updated_by",
         ]
+        expandable_fields = {
+            "patient": "PatientSerializer",
+            "created_by": "UserSerializer",
+            "updated_by": "UserSerializer",
+        }
         read_only_fields = ["created_at", "created_by", "updated_at", "updated_by"]
 
 
-class WardSerializer(serializers.HyperlinkedModelSerializer):
+class WardSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Ward
         fields = ["url", "name"]
 
 
-class AdmissionSerializer(serializers.HyperlinkedModelSerializer):
+class AdmissionSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Admission
         fields = [
@@ -106,6 +248,12 @@ class AdmissionSerializer(serializers.HyperlinkedModelSerializer):
             "updated_at",
             "updated_by",
         ]
+        expandable_fields = {
+            "ward": "WardSerializer",
+            "patient": "PatientSerializer",
+            "created_by": "UserSerializer",
+            "updated_by": "UserSerializer",
+        }
         read_only_fields = ["created_at", "created_by", "updated_at", "updated_by"]
 
 
@@ -121,7 +269,9 @@ class CustomUserDetailsSerializer(UserDetailsSerializer):
 # Nested Hyperlinked Model Serialiazers
 
 
-class AdmissionNestedSerializer(serializers.HyperlinkedModelSerializer):
+class AdmissionNestedSerializer(
+    DynamicFieldsMixin, serializers.HyperlinkedModelSerializer
+):
     created_by = UserSerializer()
     updated_by = UserSerializer()
     ward = WardSerializer()
@@ -139,10 +289,14 @@ class AdmissionNestedSerializer(serializers.HyperlinkedModelSerializer):
             "updated_at",
             "updated_by",
         ]
+        expandable_fields = AdmissionSerializer.Meta.expandable_fields
+        default_expand = ("ward", "patient", "created_by", "updated_by")
         read_only_fields = ["created_at", "created_by", "updated_at", "updated_by"]
 
 
-class PrescriptionNestedSerializer(serializers.HyperlinkedModelSerializer):
+class PrescriptionNestedSerializer(
+    DynamicFieldsMixin, serializers.HyperlinkedModelSerializer
+):
     created_by = UserSerializer()
     updated_by = UserSerializer()
     patient = PatientSerializer()
@@ -160,10 +314,14 @@ class PrescriptionNestedSerializer(serializers.HyperlinkedModelSerializer):
             "updated_at",
             "updated_by",
         ]
+        expandable_fields = PrescriptionSerializer.Meta.expandable_fields
+        default_expand = ("patient", "created_by", "updated_by")
         read_only_fields = ["created_at", "created_by", "updated_at", "updated_by"]
 
 
-class ReferralNestederializer(serializers.HyperlinkedModelSerializer):
+class ReferralNestederializer(
+    DynamicFieldsMixin, serializers.HyperlinkedModelSerializer
+):
     patient = PatientSerializer()
     doctor = UserSerializer()
     created_by = UserSerializer()
@@ -181,9 +339,85 @@ class ReferralNestederializer(serializers.HyperlinkedModelSerializer):
             "updated_at",
             "updated_by",
         ]
+        expandable_fields = ReferralSerializer.Meta.expandable_fields
+        default_expand = ("patient", "doctor", "created_by", "updated_by")
         read_only_fields = ["created_by", "updated_at", "updated_by", "created_at"]
 
 
+# Compact serializers for the patient timeline
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ["id", "username", "first_name", "last_name", "role"]
+
+
+class WardSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ward
+        fields = ["id", "name"]
+
+
+class AdmissionTimelineSerializer(serializers.ModelSerializer):
+    ward = WardSummarySerializer()
+    created_by = UserSummarySerializer()
+    updated_by = UserSummarySerializer()
+
+    class Meta:
+        model = Admission
+        fields = ["id", "ward", "created_at", "created_by", "updated_at", "updated_by"]
+
+
+class PrescriptionTimelineSerializer(serializers.ModelSerializer):
+    created_by = UserSummarySerializer()
+    updated_by = UserSummarySerializer()
+
+    class Meta:
+        model = Prescription
+        fields = [
+            "id",
+            "start_datetime",
+            "end_datetime",
+            "description",
+            "created_at",
+            "created_by",
+            "updated_at",
+            "updated_by",
+        ]
+
+
+class ReferralTimelineSerializer(serializers.ModelSerializer):
+    doctor = UserSummarySerializer()
+    created_by = UserSummarySerializer()
+    updated_by = UserSummarySerializer()
+
+    class Meta:
+        model = Referral
+        fields = [
+            "id",
+            "status",
+            "doctor",
+            "created_at",
+            "created_by",
+            "updated_at",
+            "updated_by",
+        ]
+
+
+class CustomTokenClaimsSerializer(TokenObtainPairSerializer):
+    """Adds the claims StatelessJWTAuthentication builds users from"""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in TOKEN_USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
 class CustomPasswordResetSerializer(PasswordResetSerializer):
+    password_reset_form_class = QueuedPasswordResetForm
+
     def get_email_options(self):
         return {"email_template_name": "password_reset_email.html"}
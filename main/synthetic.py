@@ -0,0 +1,437 @@
+"""
+Synthetic data for load and scale testing, see `manage.py seed_synthetic`
+
+The rows follow the shape of a busy hospital rather than a uniform spread:
+registrations grow over the period, fall at weekends and peak in the
+morning; a few doctors receive most referrals; older referrals are mostly
+closed. Patients, referrals, admissions and prescriptions are streamed to
+PostgreSQL with COPY in batches, so millions of rows take minutes and
+little memory. Row ids are allocated up front under a table lock, which
+lets the related rows be written without reading the ids back.
+
+The same seed, sizes and end date always give the same rows.
+"""
+import bisect
+import csv
+import datetime
+import io
+import itertools
+import random
+from array import array
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from main.choices import (
+    ADMITTED,
+    DISCHARGED,
+    DOCTOR,
+    IN_PROGRESS,
+    NOT_SEEN,
+    NURSE,
+    RECEPTIONIST,
+    STUDENT_CLINICIAN,
+)
+from main.counters import rebuild_counters
+from main.models import Admission, Patient, Prescription, Referral, User, Ward
+from main.reference import CLINICIANS, WARDS, bump_version
+
+# share of the staff in each role
+ROLE_MIX = {RECEPTIONIST: 0.2, DOCTOR: 0.3, NURSE: 0.35, STUDENT_CLINICIAN: 0.15}
+
+# referrals, admissions and prescriptions per patient, on average
+REFERRALS_PER_PATIENT = 1.5
+ADMISSIONS_PER_PATIENT = 0.3
+PRESCRIPTIONS_PER_PATIENT = 2.0
+
+# referrals to the doctor ranked n are proportional to 1 / n ** skew
+REFERRAL_SKEW = 1.1
+
+# registrations by hour of the day, the clinic opens at 8
+# fmt: off
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 4, 12, 14, 13, 11, 8, 9, 10, 9, 7, 5, 3, 2, 2, 1, 1, 1]
+# fmt: on
+WEEKEND_FACTOR = 0.4
+# the last day of the period sees this many times the registrations of the first
+GROWTH = 3.0
+
+# mean hours from registration to a referral, admission or prescription
+FOLLOW_UP_HOURS = 48
+
+OPEN_REFERRAL_DAYS = 3
+OPEN_REFERRAL_STATUSES = {NOT_SEEN: 0.6, IN_PROGRESS: 0.3, ADMITTED: 0.1}
+CLOSED_REFERRAL_STATUSES = {
+    DISCHARGED: 0.6,
+    ADMITTED: 0.2,
+    NOT_SEEN: 0.15,
+    IN_PROGRESS: 0.05,
+}
+
+# fmt: off
+FIRST_NAMES = [
+    "Aisha", "Brian", "Catherine", "Daniel", "Esther", "Francis", "Grace",
+    "Henry", "Irene", "Joseph", "Kevin", "Lydia", "Moses", "Naomi", "Oscar",
+    "Patience", "Quentin", "Ruth", "Samuel", "Teddy", "Umar", "Vivian",
+    "Winnie", "Yusuf", "Zaina",
+]
+LAST_NAMES = [
+    "Akello", "Byaruhanga", "Kato", "Mugisha", "Nakato", "Nansubuga",
+    "Ochieng", "Okello", "Opio", "Ssempala", "Tumusiime", "Wasswa",
+]
+ADDRESSES = [
+    "Kampala", "Entebbe", "Jinja", "Mbarara", "Gulu", "Mukono", "Wakiso",
+    "Masaka", "Mbale", "Lira", "Fort Portal", "Arua",
+]
+WARD_NAMES = [
+    "General", "Maternity", "Paediatrics", "Surgical", "Medical",
+    "Orthopaedic", "Intensive Care", "Isolation", "Oncology", "Cardiology",
+]
+# fmt: on
+DESCRIPTIONS = [
+    "Take two tablets every morning after breakfast",
+    "One tablet three times a day for seven days",
+    "Apply the ointment twice a day to the affected area",
+    "Take one capsule at night before going to bed",
+    "Dissolve one sachet in water, drink after meals",
+]
+
+# rows sent per COPY statement
+BATCH_SIZE = 50000
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+class SyntheticData:
+    def __init__(
+        self, seed=0, patients=100000, staff=200, wards=10, days=365, end=None
+    ):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.patients = patients
+        self.staff = staff
+        self.wards = wards
+        self.days = days
+        end = end or datetime.date.today()
+        # the period ends at the end of that day, UTC
+        self.end = datetime.datetime.combine(
+            end + datetime.timedelta(days=1), datetime.time(), datetime.timezone.utc
+        )
+        self.start = self.end - datetime.timedelta(days=days)
+
+    # STAFF AND WARDS
+
+    def staff_roles(self):
+        """Roles for every staff member, in the proportions of ROLE_MIX"""
+        roles = []
+        for role, share in ROLE_MIX.items():
+            roles += [role] * max(1, round(self.staff * share))
+        return roles
+
+    def create_staff(self):
+        """Create the users, returns their ids by role"""
+        password = make_password(f"synthetic-{self.seed}")
+        users = []
+        for index, role in enumerate(self.staff_roles()):
+            first_name = self.rng.choice(FIRST_NAMES)
+            last_name = self.rng.choice(LAST_NAMES)
+            username = f"synthetic{self.seed}-{index}"
+            users.append(
+                User(
+                    username=username,
+                    email=f"{username}@synthetic.liveup.test",
+                    first_name=first_name,
+                    last_name=last_name,
+                    phone_number=self.phone_number(),
+                    role=role,
+                    password=password,
+                    date_joined=self.start,
+                )
+            )
+        users = User.objects.bulk_create(users)
+
+        by_role = {role: [] for role in ROLE_MIX}
+        for user in users:
+            by_role[user.role].append(user.pk)
+        return by_role
+
+    def create_wards(self, created_by):
+        names = [
+            WARD_NAMES[index % len(WARD_NAMES)]
+            + (f" {index // len(WARD_NAMES) + 1}" if index >= len(WARD_NAMES) else "")
+            for index in range(self.wards)
+        ]
+        wards = Ward.objects.bulk_create(
+            Ward(name=name, created_by_id=self.rng.choice(created_by)) for name in names
+        )
+        Ward.objects.filter(pk__in=[ward.pk for ward in wards]).update(
+            created_at=self.start
+        )
+        return [ward.pk for ward in wards]
+
+    # TIMES
+
+    def registration_times(self):
+        """Sorted registration times as POSIX timestamps"""
+        day_weights = []
+        for day in range(self.days):
+            date = self.start + datetime.timedelta(days=day)
+            weight = 1 + (GROWTH - 1) * day / max(1, self.days - 1)
+            if date.weekday() >= 5:
+                weight *= WEEKEND_FACTOR
+            day_weights.append(weight)
+
+        start = self.start.timestamp()
+        days = self.rng.choices(
+            range(self.days), cum_weights=cumulative(day_weights), k=self.patients
+        )
+        hours = self.rng.choices(
+            range(24), cum_weights=cumulative(HOUR_WEIGHTS), k=self.patients
+        )
+        times = array(
+            "d",
+            sorted(
+                start + day * 86400 + hour * 3600 + self.rng.random() * 3600
+                for day, hour in zip(days, hours)
+            ),
+        )
+        return times
+
+    def pick(self, cum_weights):
+        """An index drawn with the given cumulative weights"""
+        return bisect.bisect(cum_weights, self.rng.random() * cum_weights[-1])
+
+    def follow_up(self, registered):
+        """A time after a registration, within the period"""
+        delay = self.rng.expovariate(1 / (FOLLOW_UP_HOURS * 3600))
+        return min(registered + delay, self.end.timestamp() - 1)
+
+    def timestamp(self, seconds):
+        return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+    # ROWS
+
+    def phone_number(self):
+        return f"+2567{self.rng.randrange(10**8):08d}"
+
+    def patient_rows(self, first_id, times, receptionists):
+        today = self.end.date()
+        for offset, registered in enumerate(times):
+            age = min(int(self.rng.expovariate(1 / 28)), 95)
+            born = today - datetime.timedelta(
+                days=age * 365 + self.rng.randrange(365) + 1
+            )
+            age = (
+                today.year
+                - born.year
+                - ((today.month, today.day) < (born.month, born.day))
+            )
+            name = f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+            yield (
+                first_id + offset,
+                self.rng.choice(LAST_NAMES),
+                self.rng.choice(ADDRESSES),
+                born,
+                age,
+                self.phone_number(),
+                name,
+                self.timestamp(registered),
+                self.rng.choice(receptionists),
+            )
+
+    def referral_rows(self, first_id, patient_ids, times, doctors, receptionists):
+        # the first doctors receive most referrals
+        doctor_weights = cumulative(
+            1 / rank**REFERRAL_SKEW for rank in range(1, len(doctors) + 1)
+        )
+        open_statuses = (
+            list(OPEN_REFERRAL_STATUSES),
+            list(OPEN_REFERRAL_STATUSES.values()),
+        )
+        closed_statuses = (
+            list(CLOSED_REFERRAL_STATUSES),
+            list(CLOSED_REFERRAL_STATUSES.values()),
+        )
+        open_after = self.end.timestamp() - OPEN_REFERRAL_DAYS * 86400
+        count = round(len(patient_ids) * REFERRALS_PER_PATIENT)
+
+        for offset in range(count):
+            index = self.rng.randrange(len(patient_ids))
+            created = self.follow_up(times[index])
+            statuses = open_statuses if created > open_after else closed_statuses
+            yield (
+                first_id + offset,
+                patient_ids[index],
+                doctors[self.pick(doctor_weights)],
+                self.rng.choices(*statuses)[0],
+                self.timestamp(created),
+                self.rng.choice(receptionists),
+            )
+
+    def admission_rows(self, first_id, patient_ids, times, wards, clinicians):
+        # bigger wards first, as with the doctors
+        ward_weights = cumulative(1 / rank for rank in range(1, len(wards) + 1))
+        count = round(len(patient_ids) * ADMISSIONS_PER_PATIENT)
+
+        for offset in range(count):
+            index = self.rng.randrange(len(patient_ids))
+            yield (
+                first_id + offset,
+                wards[self.pick(ward_weights)],
+                patient_ids[index],
+                self.timestamp(self.follow_up(times[index])),
+                self.rng.choice(clinicians),
+            )
+
+    def prescription_rows(self, first_id, patient_ids, times, clinicians):
+        count = round(len(patient_ids) * PRESCRIPTIONS_PER_PATIENT)
+
+        for offset in range(count):
+            index = self.rng.randrange(len(patient_ids))
+            created = self.follow_up(times[index])
+            start = created + self.rng.randrange(0, 86400)
+            yield (
+                first_id + offset,
+                patient_ids[index],
+                self.timestamp(start),
+                self.timestamp(start + self.rng.randrange(1, 30) * 86400),
+                self.rng.choice(DESCRIPTIONS),
+                self.timestamp(created),
+                self.rng.choice(clinicians),
+            )
+
+    # LOADING
+
+    def generate(self, log=lambda message: None):
+        """Create the rows, returns how many were created per model"""
+        with transaction.atomic():
+            by_role = self.create_staff()
+            receptionists = by_role[RECEPTIONIST]
+            doctors = by_role[DOCTOR]
+            clinicians = doctors + by_role[NURSE] + by_role[STUDENT_CLINICIAN]
+            wards = self.create_wards(doctors)
+            log(f"{len(receptionists) + len(clinicians)} users, {len(wards)} wards")
+
+            times = self.registration_times()
+            first_id = reserve_ids(Patient, len(times))
+            patients = copy_rows(
+                Patient,
+                [
+                    "id",
+                    "next_of_kin",
+                    "address",
+                    "date_of_birth",
+                    "age",
+                    "contacts",
+                    "patient_name",
+                    "created_at",
+                    "created_by_id",
+                ],
+                self.patient_rows(first_id, times, receptionists),
+            )
+            log(f"{patients} patients")
+            patient_ids = range(first_id, first_id + patients)
+
+            count = round(patients * REFERRALS_PER_PATIENT)
+            referrals = copy_rows(
+                Referral,
+                [
+                    "id",
+                    "patient_id",
+                    "doctor_id",
+                    "status",
+                    "created_at",
+                    "created_by_id",
+                ],
+                self.referral_rows(
+                    reserve_ids(Referral, count),
+                    patient_ids,
+                    times,
+                    doctors,
+                    receptionists,
+                ),
+            )
+            log(f"{referrals} referrals")
+
+            count = round(patients * ADMISSIONS_PER_PATIENT)
+            admissions = copy_rows(
+                Admission,
+                ["id", "ward_id", "patient_id", "created_at", "created_by_id"],
+                self.admission_rows(
+                    reserve_ids(Admission, count), patient_ids, times, wards, clinicians
+                ),
+            )
+            log(f"{admissions} admissions")
+
+            count = round(patients * PRESCRIPTIONS_PER_PATIENT)
+            prescriptions = copy_rows(
+                Prescription,
+                [
+                    "id",
+                    "patient_id",
+                    "start_datetime",
+                    "end_datetime",
+                    "description",
+                    "created_at",
+                    "created_by_id",
+                ],
+                self.prescription_rows(
+                    reserve_ids(Prescription, count), patient_ids, times, clinicians
+                ),
+            )
+            log(f"{prescriptions} prescriptions")
+
+            # neither bulk_create nor COPY sends the signals which keep
+            # these up to date
+            rebuild_counters()
+            transaction.on_commit(lambda: bump_version(WARDS))
+            transaction.on_commit(lambda: bump_version(CLINICIANS))
+
+        return {
+            User: len(receptionists) + len(clinicians),
+            Ward: len(wards),
+            Patient: patients,
+            Referral: referrals,
+            Admission: admissions,
+            Prescription: prescriptions,
+        }
+
+
+def reserve_ids(model, count):
+    """
+    Move the id sequence of model past count new ids and return the first
+
+    The table stays locked against other writers until the transaction
+    ends, so the ids cannot collide with rows inserted meanwhile.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            f"SELECT COALESCE(MAX(id), 0), pg_get_serial_sequence(%s, 'id') "
+            f"FROM {table}",
+            [model._meta.db_table],
+        )
+        last_id, sequence = cursor.fetchone()
+        cursor.execute("SELECT setval(%s, %s)", [sequence, last_id + max(count, 1)])
+    return last_id + 1
+
+
+def copy_rows(model, columns, rows):
+    """COPY rows into the table of model in batches, returns the row count"""
+    statement = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+        connection.ops.quote_name(model._meta.db_table),
+        ", ".join(connection.ops.quote_name(column) for column in columns),
+    )
+    total = 0
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(itertools.islice(rows, BATCH_SIZE))
+            if not batch:
+                return total
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            total += len(batch)
@@ -0,0 +1,108 @@
+"""
+A patient's admissions, prescriptions and referrals as one timeline
+
+The three tables are merged with a UNION ALL of (created_at, kind, id)
+ordered newest first. Every branch is cut down to the page size on the
+(patient, -created_at) indexes before the merge, then only the rows on the
+page are loaded with the related rows their serializer needs.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db.models import CharField, Q, Value
+
+from main.models import Admission, Prescription, Referral
+from main.serializers import (
+    AdmissionTimelineSerializer,
+    PrescriptionTimelineSerializer,
+    ReferralTimelineSerializer,
+)
+
+TimelineSource = namedtuple(
+    "TimelineSource", ["kind", "model", "serializer_class", "related"]
+)
+
+TIMELINE_SOURCES = {
+    source.kind: source
+    for source in (
+        TimelineSource(
+            "admission",
+            Admission,
+            AdmissionTimelineSerializer,
+            ("ward", "created_by", "updated_by"),
+        ),
+        TimelineSource(
+            "prescription",
+            Prescription,
+            PrescriptionTimelineSerializer,
+            ("created_by", "updated_by"),
+        ),
+        TimelineSource(
+            "referral",
+            Referral,
+            ReferralTimelineSerializer,
+            ("doctor", "created_by", "updated_by"),
+        ),
+    )
+}
+
+TimelineEntry = namedtuple("TimelineEntry", ["created_at", "kind", "pk", "instance"])
+
+
+def _after(kind, position):
+    """Rows of kind which come after position in the timeline order"""
+    created_at, position_kind, pk = position
+    if kind < position_kind:
+        return Q(created_at__lte=created_at)
+    if kind == position_kind:
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    return Q(created_at__lt=created_at)
+
+
+def patient_timeline(patient_id, position=None, limit=20):
+    """The patient's next limit TimelineEntries after position, newest first"""
+    branches = []
+    for kind, source in TIMELINE_SOURCES.items():
+        queryset = source.model.objects.filter(patient=patient_id)
+        if position is not None:
+            queryset = queryset.filter(_after(kind, position))
+        branches.append(
+            queryset.annotate(kind=Value(kind, output_field=CharField()))
+            .values_list("created_at", "kind", "id")
+            .order_by("-created_at", "-id")[:limit]
+        )
+
+    rows = list(
+        branches[0]
+        .union(*branches[1:], all=True)
+        .order_by("-created_at", "-kind", "-id")[:limit]
+    )
+
+    ids = defaultdict(list)
+    for _, kind, pk in rows:
+        ids[kind].append(pk)
+
+    instances = {
+        kind: TIMELINE_SOURCES[kind]
+        .model.objects.select_related(*TIMELINE_SOURCES[kind].related)
+        .in_bulk(pks)
+        for kind, pks in ids.items()
+    }
+
+    return [
+        TimelineEntry(created_at, kind, pk, instances[kind][pk])
+        for created_at, kind, pk in rows
+        # skip rows deleted between the two queries
+        if pk in instances[kind]
+    ]
+
+
+def serialize_timeline(entries, context=None):
+    return [
+        {
+            "type": entry.kind,
+            **TIMELINE_SOURCES[entry.kind]
+            .serializer_class(entry.instance, context=context)
+            .data,
+        }
+        for entry in entries
+    ]
@@ -2,22 +2,26 @@ from email.mime import base
 from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 from rest_framework.permissions import AllowAny
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.conf import settings
 
+from main.schema import get_cached_schema_view
 from main.views import (
+    AdmissionExportView,
     AdmissionViewSet,
     ClinicianAssignedPatientsViewSet,
     ClinicianStatAPIView,
     PatientAdmissionInfoViewSet,
+    PatientExportView,
     PatientPrescriptionInfoViewSet,
     PatientReferralInfoViewSet,
     PatientViewSet,
     PatientsByName,
+    PrescriptionExportView,
     PrescriptionViewSet,
     ReceptionistPatientView,
     ReceptionistStatAPIView,
+    ReferralExportView,
     ReferralViewSet,
     UserViewSet,
     WardViewSet,
@@ -44,7 +48,7 @@ router.register(
 )
 router.register(r"referrals-info", PatientReferralInfoViewSet, basename="referral-info")
 
-schema_view = get_schema_view(
+schema_view = get_cached_schema_view(
     openapi.Info(
         title="LiveUp API",
         default_version="v1",
@@ -62,6 +66,14 @@ urlpatterns = [
     path("receptionists/stats/", ReceptionistStatAPIView.as_view()),
     path("medics/stats/", ClinicianStatAPIView.as_view()),
     path("patient/by-name/", PatientsByName.as_view()),
+    path("exports/patients/", PatientExportView.as_view(), name="patient-export"),
+    path("exports/referrals/", ReferralExportView.as_view(), name="referral-export"),
+    path("exports/admissions/", AdmissionExportView.as_view(), name="admission-export"),
+    path(
+        "exports/prescriptions/",
+        PrescriptionExportView.as_view(),
+        name="prescription-export",
+    ),
     path("", include(router.urls)),
     re_path(
         r"^swagger(?P<format>\.json|\.yaml)$",
@@ -1,63 +1,89 @@
-from django.utils import timezone
-from .models import Referral, Patient, Prescription, Admission
+import functools
 
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
 
-def generate_receptionist_stats(request):
-    today = timezone.now().date()
+from main.counters import read_counters
+from .models import Patient
+
+# Upper bound on matches a single search can page through
+MAX_SEARCH_RESULTS = 200
 
-    referrals = Referral.objects.all().count()
-    referrals_by_user = Referral.objects.filter(created_by=request.user).count()
-    referrals_today_by_user = Referral.objects.filter(
-        created_by=request.user, created_at__date=today
-    ).count()
 
-    patients = Patient.objects.all().count()
-    patients_by_user = Patient.objects.filter(created_by=request.user).count()
-    patients_today_by_user = Patient.objects.filter(
-        created_by=request.user, created_at__date=today
-    ).count()
+def generate_receptionist_stats(request):
+    counts = read_counters(request.user.pk)
 
     stats = {
-        "referrals": referrals,
-        "referrals_by_user": referrals_by_user,
-        "referrals_today_by_user": referrals_today_by_user,
-        "patients": patients,
-        "patients_by_user": patients_by_user,
-        "patients_today_by_user": patients_today_by_user,
+        "referrals": counts["referrals"],
+        "referrals_by_user": counts["referrals_by_user"],
+        "referrals_today_by_user": counts["referrals_today_by_user"],
+        "patients": counts["patients"],
+        "patients_by_user": counts["patients_by_user"],
+        "patients_today_by_user": counts["patients_today_by_user"],
     }
     return stats
 
 
 def generate_clinician_stats(request):
-    today = timezone.now().date()
-
-    referrals = Referral.objects.all().count()
-    referrals_to_user = Referral.objects.filter(doctor=request.user).count()
-    referrals_today_to_user = Referral.objects.filter(
-        doctor=request.user, created_at__date=today
-    ).count()
-
-    admissions = Admission.objects.all().count()
-    admissions_by_user = Admission.objects.filter(created_by=request.user).count()
-    admissions_today_by_user = Admission.objects.filter(
-        created_by=request.user, created_at__date=today
-    ).count()
-
-    prescriptions = Prescription.objects.all().count()
-    prescriptions_by_user = Prescription.objects.filter(created_by=request.user).count()
-    prescriptions_today_by_user = Prescription.objects.filter(
-        created_by=request.user, created_at__date=today
-    ).count()
+    counts = read_counters(request.user.pk)
 
     stats = {
-        "referrals": referrals,
-        "referrals_to_user": referrals_to_user,
-        "referrals_today_to_user": referrals_today_to_user,
-        "admissions": admissions,
-        "admissions_by_user": admissions_by_user,
-        "admissions_today_by_user": admissions_today_by_user,
-        "prescriptions": prescriptions,
-        "prescriptions_by_user": prescriptions_by_user,
-        "prescriptions_today_by_user": prescriptions_today_by_user,
+        "referrals": counts["referrals"],
+        "referrals_to_user": counts["referrals_to_user"],
+        "referrals_today_to_user": counts["referrals_today_to_user"],
+        "admissions": counts["admissions"],
+        "admissions_by_user": counts["admissions_by_user"],
+        "admissions_today_by_user": counts["admissions_today_by_user"],
+        "prescriptions": counts["prescriptions"],
+        "prescriptions_by_user": counts["prescriptions_by_user"],
+        "prescriptions_today_by_user": counts["prescriptions_today_by_user"],
     }
     return stats
+
+
+@functools.lru_cache(maxsize=None)
+def trigram_search_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def search_patients(term):
+    """
+    Patients whose name, number or contacts match term, best match first
+    Names are matched fuzzily when pg_trgm is installed
+    """
+    matches = (
+        Q(patient_name__icontains=term)
+        | Q(patient_number__icontains=term)
+        | Q(contacts__icontains=term)
+    )
+
+    if trigram_search_available():
+        # compare UPPER(patient_name) like icontains does so the fuzzy
+        # match uses the same trigram index
+        queryset = (
+            Patient.objects.annotate(search_name=Upper("patient_name"))
+            .filter(matches | Q(search_name__trigram_similar=term.upper()))
+            .annotate(
+                rank=Greatest(
+                    TrigramSimilarity("patient_name", term),
+                    TrigramSimilarity("patient_number", term),
+                    TrigramSimilarity("contacts", term),
+                )
+            )
+        )
+    else:
+        queryset = Patient.objects.filter(matches).annotate(
+            rank=Case(
+                When(patient_name__iexact=term, then=Value(2)),
+                When(patient_number__iexact=term, then=Value(2)),
+                When(patient_name__istartswith=term, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+
+    return queryset.order_by("-rank", "-created_at", "-id")[:MAX_SEARCH_RESULTS]
@@ -1,14 +1,40 @@
-from rest_framework import viewsets
+from asgiref.sync import sync_to_async
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 
 from main.choices import DOCTOR, NURSE, STUDENT_CLINICIAN
+from main.mixins import (
+    AsyncViewMixin,
+    CompactMixin,
+    ConditionalGetMixin,
+    ReferenceListMixin,
+    ReplicaReadMixin,
+    SparseFieldsMixin,
+)
 
 from main.models import Admission, Patient, Prescription, Referral, User, Ward
-from main.view_helpers import generate_clinician_stats, generate_receptionist_stats
+from main.reference import CLINICIANS, WARDS
+from main.pagination import (
+    OptionalKeysetPagination,
+    PatientSearchPagination,
+    TimelinePagination,
+)
+from main.renderers import CSVRenderer, NDJSONRenderer
+from main.patient_import import ImportFormatError, detect_format, import_patients
+from main.timeline import patient_timeline, serialize_timeline
+from main.view_helpers import (
+    generate_clinician_stats,
+    generate_receptionist_stats,
+    search_patients,
+)
 from .serializers import (
     AdmissionNestedSerializer,
     AdmissionSerializer,
@@ -23,10 +49,13 @@ from .serializers import (
 from .permissions import IsNurse, IsReceptionist, IsDoctor, IsStudent_Clinician
 
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(
+    ConditionalGetMixin, SparseFieldsMixin, CompactMixin, viewsets.ModelViewSet
+):
     """List, create, retreive and destroy operations for a patient"""
 
     serializer_class = PatientSerializer
+    pagination_class = OptionalKeysetPagination
     queryset = Patient.objects.all()
     permission_classes = [IsReceptionist | IsDoctor]
 
@@ -36,8 +65,60 @@ class PatientViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(updated_by=self.request.user, updated_at=timezone.now())
 
-
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk-import",
+        parser_classes=[MultiPartParser],
+    )
+    def bulk_import(self, request):
+        """Register patients from an uploaded CSV or NDJSON file"""
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": ["No file was submitted."]})
+
+        try:
+            file_format = detect_format(upload, request.data.get("file_format"))
+        except ImportFormatError as exc:
+            raise ValidationError({"file": [str(exc)]})
+
+        report = import_patients(upload, file_format, request.user)
+        if report["created"] and "file" not in report:
+            return Response(report, status=status.HTTP_201_CREATED)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+        detail=True,
+        permission_classes=[IsDoctor | IsNurse | IsStudent_Clinician],
+        pagination_class=TimelinePagination,
+    )
+    def timeline(self, request, pk=None):
+        """
+        A patient's admissions, prescriptions and referrals, newest first
+        Follow the next link for older entries
+        """
+        try:
+            patient_id = int(pk)
+        except ValueError:
+            raise Http404
+
+        paginator = self.paginator
+        entries = paginator.paginate_timeline(
+            lambda position, limit: patient_timeline(patient_id, position, limit),
+            request,
+        )
+        # only look the patient up when there is nothing to show
+        if not entries and not Patient.objects.filter(pk=patient_id).exists():
+            raise Http404
+
+        return paginator.get_paginated_response(
+            serialize_timeline(entries, self.get_serializer_context())
+        )
+
+
+class UserViewSet(
+    ReplicaReadMixin, SparseFieldsMixin, CompactMixin, viewsets.ReadOnlyModelViewSet
+):
     """List, create, retreive and destroy operations for a user"""
 
     serializer_class = UserSerializer
@@ -45,24 +126,30 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class ReceptionistPatientView(viewsets.ReadOnlyModelViewSet):
+class ReceptionistPatientView(
+    ConditionalGetMixin, SparseFieldsMixin, CompactMixin, viewsets.ReadOnlyModelViewSet
+):
     """Get patients registered by a particular receptionist"""
 
     serializer_class = PatientSerializer
+    pagination_class = OptionalKeysetPagination
     permission_classes = [IsReceptionist]
 
     def get_queryset(self):
-        user = self.request.user
-        return Patient.objects.filter(created_by=user)
+        # request.user may be built from the token, filter on its id
+        return Patient.objects.filter(created_by=self.request.user.pk)
 
 
-class ReferralViewSet(viewsets.ModelViewSet):
+class ReferralViewSet(
+    ConditionalGetMixin, SparseFieldsMixin, CompactMixin, viewsets.ModelViewSet
+):
     """
     List, create, retreive and destroy
     operations for a patient referred to a clinician
     """
 
     serializer_class = ReferralSerializer
+    pagination_class = OptionalKeysetPagination
     permission_classes = [IsAuthenticated]
     queryset = Referral.objects.all()
 
@@ -73,17 +160,22 @@ class ReferralViewSet(viewsets.ModelViewSet):
         serializer.save(updated_by=self.request.user, updated_at=timezone.now())
 
 
-class ClinicianAssignedPatientsViewSet(viewsets.ReadOnlyModelViewSet):
+class ClinicianAssignedPatientsViewSet(
+    ConditionalGetMixin, SparseFieldsMixin, CompactMixin, viewsets.ReadOnlyModelViewSet
+):
     """Get patients assigned to a particular clinician"""
 
     serializer_class = ReferralSerializer
+    pagination_class = OptionalKeysetPagination
     permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician]
 
     def get_queryset(self):
-        return Referral.objects.filter(doctor=self.request.user)
+        return Referral.objects.filter(doctor=self.request.user.pk)
 
 
-class PrescriptionViewSet(viewsets.ModelViewSet):
+class PrescriptionViewSet(
+    ConditionalGetMixin, SparseFieldsMixin, CompactMixin, viewsets.ModelViewSet
+):
     """
     List, create, retreive and destroy
     operations for a patient's prescription
@@ -91,6 +183,7 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
     """
 
     serializer_class = PrescriptionSerializer
+    pagination_class = OptionalKeysetPagination
     queryset = Prescription.objects.all()
 
     def get_permissions(self):
@@ -107,13 +200,16 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         serializer.save(updated_at=timezone.now(), updated_by=self.request.user)
 
 
-class AdmissionViewSet(viewsets.ModelViewSet):
+class AdmissionViewSet(
+    ConditionalGetMixin, SparseFieldsMixin, CompactMixin, viewsets.ModelViewSet
+):
     """
     List, create, retreive and destroy operations for an admitted patient to
     a particular ward
     """
 
     serializer_class = AdmissionSerializer
+    pagination_class = OptionalKeysetPagination
     queryset = Admission.objects.all()
 
     def get_permissions(self):
@@ -130,7 +226,12 @@ class AdmissionViewSet(viewsets.ModelViewSet):
         serializer.save(updated_at=timezone.now(), updated_by=self.request.user)
 
 
-class WardViewSet(viewsets.ReadOnlyModelViewSet):
+class WardViewSet(
+    ReplicaReadMixin,
+    ReferenceListMixin,
+    SparseFieldsMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     """
     List, create, retreive and destroy operations for a ward
     """
@@ -139,9 +240,10 @@ class WardViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ward.objects.all()
     permission_classes = [IsAuthenticated]
     pagination_class = None
+    reference_list = WARDS
 
 
-class ReceptionistStatAPIView(APIView):
+class ReceptionistStatAPIView(ReplicaReadMixin, AsyncViewMixin, APIView):
     """
     Fetch statistics for a particular receptionist
     e.g Number of patients registered today
@@ -149,12 +251,12 @@ class ReceptionistStatAPIView(APIView):
 
     permission_classes = [IsReceptionist]
 
-    def get(self, request, format=None):
-        stats = generate_receptionist_stats(request)
+    async def get(self, request, format=None):
+        stats = await sync_to_async(generate_receptionist_stats)(request)
         return Response(stats)
 
 
-class ClinicianStatAPIView(APIView):
+class ClinicianStatAPIView(ReplicaReadMixin, AsyncViewMixin, APIView):
     """
     Fetch statistics for a particular clinician
     e.g Number of patients admitted today
@@ -162,12 +264,17 @@ class ClinicianStatAPIView(APIView):
 
     permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician]
 
-    def get(self, request, format=None):
-        stats = generate_clinician_stats(request)
+    async def get(self, request, format=None):
+        stats = await sync_to_async(generate_clinician_stats)(request)
         return Response(stats)
 
 
-class ClinicianInfoViewSet(viewsets.ReadOnlyModelViewSet):
+class ClinicianInfoViewSet(
+    ReplicaReadMixin,
+    ReferenceListMixin,
+    SparseFieldsMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     """
     Fetch users who are only clinicians
     A clinician is either a Doctor, Nurse
@@ -177,12 +284,15 @@ class ClinicianInfoViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = None
+    reference_list = CLINICIANS
 
     def get_queryset(self):
         return User.objects.filter(role__in=[DOCTOR, NURSE, STUDENT_CLINICIAN])
 
 
-class PatientAdmissionInfoViewSet(viewsets.ReadOnlyModelViewSet):
+class PatientAdmissionInfoViewSet(
+    ReplicaReadMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet
+):
     """
     Fetch admission data for a particular patient
     A patient id is required as query param
@@ -192,17 +302,24 @@ class PatientAdmissionInfoViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician]
     serializer_class = AdmissionNestedSerializer
     pagination_class = None
+    # authentication + admissions with their related rows
+    query_budget = 2
 
     def get_queryset(self):
         patient_id = self.request.query_params.get("patient_id")
+        queryset = Admission.objects.select_related(
+            "ward", "patient", "created_by", "updated_by"
+        )
 
         if not patient_id:
-            return Admission.objects.all()
+            return queryset
 
-        return Admission.objects.filter(patient=patient_id)
+        return queryset.filter(patient=patient_id)
 
 
-class PatientPrescriptionInfoViewSet(viewsets.ReadOnlyModelViewSet):
+class PatientPrescriptionInfoViewSet(
+    ReplicaReadMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet
+):
     """
     Fetch prescription data for a particular patient
     A patient id is required as query param
@@ -212,17 +329,24 @@ class PatientPrescriptionInfoViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = PrescriptionNestedSerializer
     permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician]
     pagination_class = None
+    # authentication + prescriptions with their related rows
+    query_budget = 2
 
     def get_queryset(self):
         patient_id = self.request.query_params.get("patient_id")
+        queryset = Prescription.objects.select_related(
+            "patient", "created_by", "updated_by"
+        )
 
         if not patient_id:
-            return Prescription.objects.all()
+            return queryset
 
-        return Prescription.objects.filter(patient=patient_id)
+        return queryset.filter(patient=patient_id)
 
 
-class PatientReferralInfoViewSet(viewsets.ReadOnlyModelViewSet):
+class PatientReferralInfoViewSet(
+    ReplicaReadMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet
+):
     """
     View referral history of a patient or all patients
     Add patient_id as query param to get history for a patient
@@ -231,29 +355,184 @@ class PatientReferralInfoViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = ReferralNestederializer
     permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician | IsReceptionist]
     pagination_class = None
+    # authentication + referrals with their related rows
+    query_budget = 2
 
     def get_queryset(self):
         patient_id = self.request.query_params.get("patient_id")
+        queryset = Referral.objects.select_related(
+            "patient", "doctor", "created_by", "updated_by"
+        )
 
         if not patient_id:
-            return Referral.objects.all()
+            return queryset
 
-        return Referral.objects.filter(patient=patient_id)
+        return queryset.filter(patient=patient_id)
 
 
-class PatientsByName(generics.ListAPIView):
+class PatientsByName(SparseFieldsMixin, CompactMixin, generics.ListAPIView):
     """
-    Fetch a patient's data using their name
-    patient_name query param is required
+    Search patients by name, patient number or contacts
+    The q (or patient_name) query param is required
+    Results are ranked by similarity and paginated
     """
 
     serializer_class = PatientSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = None
+    pagination_class = PatientSearchPagination
+
+    def get_queryset(self):
+        term = self.request.query_params.get(
+            "q", self.request.query_params.get("patient_name", "")
+        ).strip()
+        if not term:
+            raise ValidationError({"q": "A search term is required."})
+        return search_patients(term)
+
+
+class ExportAPIView(APIView):
+    """
+    Base for the export endpoints
+    Rows are read from a server-side cursor and streamed as NDJSON (default)
+    or CSV (?format=csv or Accept: text/csv), so memory use does not grow
+    with the number of rows exported
+    """
+
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+    # (column, field lookup) pairs in output order
+    columns = ()
+    filename = None
+    # rows fetched from the cursor per round trip
+    chunk_size = 2000
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get(self, request, format=None):
+        headers = [column for column, _ in self.columns]
+        rows = (
+            self.get_queryset()
+            .order_by("id")
+            .values_list(*[lookup for _, lookup in self.columns])
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.render_rows(headers, rows),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="{self.filename}.{renderer.format}"'
+        return response
+
+
+class PatientExportView(ExportAPIView):
+    """Export all patients"""
+
+    permission_classes = [IsReceptionist | IsDoctor]
+    queryset = Patient.objects.all()
+    filename = "patients"
+    columns = (
+        ("id", "id"),
+        ("patient_number", "patient_number"),
+        ("patient_name", "patient_name"),
+        ("next_of_kin", "next_of_kin"),
+        ("address", "address"),
+        ("date_of_birth", "date_of_birth"),
+        ("age", "age"),
+        ("contacts", "contacts"),
+        ("created_by", "created_by"),
+        ("created_at", "created_at"),
+        ("updated_by", "updated_by"),
+        ("updated_at", "updated_at"),
+    )
+
+
+class ReferralExportView(ExportAPIView):
+    """
+    Export referrals
+    Add patient_id as query param to export a patient's referrals only
+    """
+
+    permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician | IsReceptionist]
+    queryset = Referral.objects.all()
+    filename = "referrals"
+    columns = (
+        ("id", "id"),
+        ("patient", "patient"),
+        ("patient_number", "patient__patient_number"),
+        ("patient_name", "patient__patient_name"),
+        ("status", "status"),
+        ("doctor", "doctor"),
+        ("created_by", "created_by"),
+        ("created_at", "created_at"),
+        ("updated_by", "updated_by"),
+        ("updated_at", "updated_at"),
+    )
 
     def get_queryset(self):
-        patient_name = self.request.query_params.get("patient_name")
-        queryset = Patient.objects.filter(patient_name__iexact=patient_name)
-        if not queryset or len(queryset) == 0:
-            queryset = Patient.objects.filter(patient_name__icontains=patient_name)
-        return queryset
+        patient_id = self.request.query_params.get("patient_id")
+        if not patient_id:
+            return self.queryset.all()
+        return self.queryset.filter(patient=patient_id)
+
+
+class AdmissionExportView(ExportAPIView):
+    """
+    Export admissions
+    Add patient_id as query param to export a patient's admissions only
+    """
+
+    permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician]
+    queryset = Admission.objects.all()
+    filename = "admissions"
+    columns = (
+        ("id", "id"),
+        ("patient", "patient"),
+        ("patient_number", "patient__patient_number"),
+        ("patient_name", "patient__patient_name"),
+        ("ward", "ward"),
+        ("ward_name", "ward__name"),
+        ("created_by", "created_by"),
+        ("created_at", "created_at"),
+        ("updated_by", "updated_by"),
+        ("updated_at", "updated_at"),
+    )
+
+    def get_queryset(self):
+        patient_id = self.request.query_params.get("patient_id")
+        if not patient_id:
+            return self.queryset.all()
+        return self.queryset.filter(patient=patient_id)
+
+
+class PrescriptionExportView(ExportAPIView):
+    """
+    Export prescriptions
+    Add patient_id as query param to export a patient's prescriptions only
+    """
+
+    permission_classes = [IsDoctor | IsNurse | IsStudent_Clinician]
+    queryset = Prescription.objects.all()
+    filename = "prescriptions"
+    columns = (
+        ("id", "id"),
+        ("patient", "patient"),
+        ("patient_number", "patient__patient_number"),
+        ("patient_name", "patient__patient_name"),
+        ("start_datetime", "start_datetime"),
+        ("end_datetime", "end_datetime"),
+        ("description", "description"),
+        ("created_by", "created_by"),
+        ("created_at", "created_at"),
+        ("updated_by", "updated_by"),
+        ("updated_at", "updated_at"),
+    )
+
+    def get_queryset(self):
+        patient_id = self.request.query_params.get("patient_id")
+        if not patient_id:
+            return self.queryset.all()
+        return self.queryset.filter(patient=patient_id)